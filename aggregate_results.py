@@ -0,0 +1,195 @@
+import argparse
+import glob
+import json
+import logging
+import os
+from dataclasses import MISSING, fields
+from typing import Any, Iterator
+
+import pandas as pd
+
+from config import OPENAI_MODEL, TOKEN_PRICES_PER_MILLION
+from models import StageMetrics
+from results_store import RESULTS_FILE, ResultsStore
+
+logger = logging.getLogger(__name__)
+
+
+RESULTS_DIR = "output/experiment-results/"
+SUMMARY_FILE = "output/performance-summary.csv"
+PERCENTILES = [50, 95, 99]
+ONE_MILLION = 1_000_000
+
+RUN_COLUMNS = ["attack_id", "variant", "timestamp", "total_latency"]
+# Per-field latencies are nested, so they are left out of the frame.
+STAGE_COLUMNS = [f.name for f in fields(StageMetrics) if f.name != "field_latencies"]
+# Results saved before a metric was added lack it.
+STAGE_DEFAULTS = {
+    f.name: f.default for f in fields(StageMetrics) if f.default is not MISSING
+}
+TOKEN_COLUMNS = ["input_tokens", "output_tokens", "embedding_tokens"]
+
+
+def iter_results(results_dir: str) -> Iterator[dict[str, Any]]:
+    """
+    Yield every result in a directory: the records of its results store, then
+    its per-run JSON files.
+
+    JSON files are timestamped with their modification time, as by
+    `ResultsStore.import_json`, so files already imported into the store are
+    skipped.
+    """
+    seen = set()
+    if os.path.exists(os.path.join(results_dir, RESULTS_FILE)):
+        for record in ResultsStore(results_dir).records():
+            seen.add((record["attack_id"], record["variant"], record["timestamp"]))
+            yield record
+    for path in sorted(glob.glob(os.path.join(results_dir, "attack_*.json"))):
+        with open(path, "r") as f:
+            result = json.load(f)
+        result.setdefault("timestamp", os.path.getmtime(path))
+        if (result["attack_id"], result["variant"], result["timestamp"]) in seen:
+            continue
+        yield result
+
+
+def load_frame(results_dir: str) -> pd.DataFrame:
+    """
+    Load every result into a frame with one row per stage of each run.
+
+    Columns are filled in a single pass over the results and the frame is
+    built once from them, rather than growing a frame row by row.
+    """
+    columns: dict[str, list[Any]] = {
+        name: [] for name in ["run", *RUN_COLUMNS, *STAGE_COLUMNS]
+    }
+    run_values = [columns[name] for name in RUN_COLUMNS]
+    stage_values = [(columns[name], STAGE_DEFAULTS.get(name)) for name in STAGE_COLUMNS]
+    for run, result in enumerate(iter_results(results_dir)):
+        row = [result[name] for name in RUN_COLUMNS]
+        for stage in result["stages"]:
+            columns["run"].append(run)
+            for values, value in zip(run_values, row):
+                values.append(value)
+            for (values, default), name in zip(stage_values, STAGE_COLUMNS):
+                values.append(stage.get(name, default))
+    frame = pd.DataFrame(columns)
+    frame["variant"] = frame["variant"].astype("category")
+    frame["stage_name"] = frame["stage_name"].astype("category")
+    return frame
+
+
+def add_cost(frame: pd.DataFrame, prices: dict[str, float]) -> pd.DataFrame:
+    """Add the cost in USD of each row's input and output tokens."""
+    frame["cost"] = (
+        frame["input_tokens"] * prices["input"]
+        + frame["output_tokens"] * prices["output"]
+    ) / ONE_MILLION
+    return frame
+
+
+def summarize(
+    grouped: "pd.core.groupby.DataFrameGroupBy", latency_column: str
+) -> pd.DataFrame:
+    """Latency percentiles and token and cost totals of each group."""
+    quantiles = [p / 100 for p in PERCENTILES]
+    latencies = grouped[latency_column].quantile(quantiles)
+    # Without any groups there is nothing to unstack into the quantile columns.
+    latencies = latencies.unstack().reindex(columns=quantiles)
+    latencies.columns = [f"latency_p{p}" for p in PERCENTILES]
+    totals = grouped[[*TOKEN_COLUMNS, "cost"]].sum()
+    summary = pd.concat(
+        [
+            grouped.size().rename("runs"),
+            latencies,
+            grouped[latency_column].mean().rename("latency_mean"),
+            totals,
+        ],
+        axis=1,
+    )
+    summary["cost_per_run"] = summary["cost"] / summary["runs"]
+    return summary
+
+
+def summarize_results(frame: pd.DataFrame, prices: dict[str, float]) -> pd.DataFrame:
+    """
+    Summarize each variant's stages, and its whole runs as stage "total".
+
+    Returns:
+        pd.DataFrame: One row per variant and stage, with the latency
+        percentiles, token totals and cost.
+    """
+    frame = add_cost(frame.copy(), prices)
+    stages = summarize(
+        frame.groupby(["variant", "stage_name"], observed=True), "latency_seconds"
+    )
+    runs = frame.groupby("run").agg(
+        variant=("variant", "first"),
+        total_latency=("total_latency", "first"),
+        **{name: (name, "sum") for name in [*TOKEN_COLUMNS, "cost"]},
+    )
+    totals = summarize(runs.groupby("variant", observed=True), "total_latency")
+    totals.index = pd.MultiIndex.from_arrays(
+        [totals.index, ["total"] * len(totals)], names=["variant", "stage_name"]
+    )
+    summary = pd.concat([stages, totals]).sort_index()
+    summary.index.names = ["variant", "stage"]
+    return summary.reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Summarize the latency, tokens and cost of experiment results"
+    )
+    parser.add_argument(
+        "--results-dir",
+        type=str,
+        default=RESULTS_DIR,
+        help="Results store, or directory of per-run JSON result files",
+    )
+    parser.add_argument(
+        "--attacks", nargs="+", type=int, default=None, help="Attacks to include"
+    )
+    parser.add_argument(
+        "--variants", nargs="+", default=None, help="Variants to include"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=OPENAI_MODEL,
+        choices=list(TOKEN_PRICES_PER_MILLION),
+        help="Model whose token prices are used for the cost",
+    )
+    parser.add_argument(
+        "--output", type=str, default=SUMMARY_FILE, help="Summary CSV file"
+    )
+    args = parser.parse_args()
+
+    frame = load_frame(args.results_dir)
+    if args.attacks:
+        frame = frame[frame["attack_id"].isin(args.attacks)]
+    if args.variants:
+        frame = frame[frame["variant"].isin(args.variants)]
+    if frame.empty:
+        logger.info(f"No results to summarize in {args.results_dir}")
+        return
+    logger.info(
+        f"Loaded {frame['run'].nunique()} runs ({len(frame)} stages) "
+        f"from {args.results_dir}"
+    )
+
+    summary = summarize_results(frame, TOKEN_PRICES_PER_MILLION[args.model])
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    summary.to_csv(args.output, index=False, float_format="%.6g")
+    logger.info(f"Summary written to {args.output}:\n{summary.to_string(index=False)}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
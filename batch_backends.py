@@ -0,0 +1,236 @@
+import json
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from cache import CompletionCache
+from config import BATCH_COMPLETION_WINDOW
+from token_counting import record_usage
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch job states after which no further results will arrive.
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class CompletionDeferred(Exception):
+    """Raised when a completion has been queued for a batch job instead of made."""
+
+    def __init__(self, custom_id: str):
+        super().__init__(f"Completion {custom_id} queued for the next batch job")
+        self.custom_id = custom_id
+
+
+def make_batch_request(
+    custom_id: str,
+    model: str,
+    temperature: Optional[float],
+    output_cls: type[BaseModel],
+    prompt: str,
+) -> dict[str, Any]:
+    """Build one line of an OpenAI batch job file for a structured completion."""
+    body = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {
+                "name": output_cls.__name__,
+                "schema": output_cls.model_json_schema(),
+            },
+        },
+    }
+    if temperature is not None:
+        body["temperature"] = temperature
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": body,
+    }
+
+
+def parse_batch_output(path: str) -> dict[str, dict[str, Any]]:
+    """
+    Read an OpenAI batch output (or error) file.
+
+    Returns a mapping from custom ID to either `{"text": ..., "usage": ...}`
+    or, for failed requests, `{"error": ...}`.
+    """
+    results = {}
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            response = entry.get("response") or {}
+            if entry.get("error") or response.get("status_code") != 200:
+                results[entry["custom_id"]] = {
+                    "error": entry.get("error") or response.get("body")
+                }
+                continue
+            body = response["body"]
+            results[entry["custom_id"]] = {
+                "text": body["choices"][0]["message"]["content"],
+                "usage": body.get("usage"),
+            }
+    return results
+
+
+class BatchBackend(ABC):
+    """Service that runs a JSONL file of requests as one asynchronous job."""
+
+    @abstractmethod
+    def submit(self, job_file: str) -> str:
+        """Submit a job file and return the ID of the batch job."""
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """Return the status of a batch job (see `TERMINAL_STATUSES`)."""
+
+    @abstractmethod
+    def download(self, batch_id: str, output_file: str) -> None:
+        """Write the output and error lines of a finished batch job to a file."""
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Runs job files through the OpenAI Batch API."""
+
+    def __init__(self, client: Optional[Any] = None):
+        # Imported here since the OpenAI SDK is slow to import and only
+        # needed when this backend is used.
+        from openai import OpenAI as OpenAIClient
+
+        self.client = client or OpenAIClient(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def submit(self, job_file: str) -> str:
+        with open(job_file, "rb") as f:
+            uploaded = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, output_file: str) -> None:
+        batch = self.client.batches.retrieve(batch_id)
+        with open(output_file, "wb") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).read())
+
+
+def placeholder_response(body: dict[str, Any]) -> str:
+    """Answer a request with an empty instance of its response schema."""
+    defaults = {"string": "", "array": [], "object": {}, "boolean": False}
+    schema = body["response_format"]["json_schema"]["schema"]
+    return json.dumps(
+        {
+            name: defaults.get(field.get("type"), 0)
+            for name, field in schema.get("properties", {}).items()
+        }
+    )
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the OpenAI Batch API.
+
+    Requests are answered on submission by `responder`, which receives the
+    request body and returns the message content, and the output is written
+    in the OpenAI batch output format. Used for tests and dry runs.
+    """
+
+    def __init__(
+        self,
+        work_dir: str,
+        responder: Callable[[dict[str, Any]], str] = placeholder_response,
+    ):
+        self.work_dir = work_dir
+        self.responder = responder
+        os.makedirs(work_dir, exist_ok=True)
+
+    def __output_path(self, batch_id: str) -> str:
+        return os.path.join(self.work_dir, f"{batch_id}.responses.jsonl")
+
+    def submit(self, job_file: str) -> str:
+        batch_id = f"local-batch-{uuid.uuid4().hex}"
+        with open(job_file, "r") as f_in, open(
+            self.__output_path(batch_id), "w"
+        ) as f_out:
+            for line in f_in:
+                request = json.loads(line)
+                content = self.responder(request["body"])
+                output = {
+                    "id": f"local-request-{uuid.uuid4().hex}",
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"content": content}}]},
+                    },
+                    "error": None,
+                }
+                f_out.write(json.dumps(output) + "\n")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self.__output_path(batch_id)) else "failed"
+
+    def download(self, batch_id: str, output_file: str) -> None:
+        shutil.copyfile(self.__output_path(batch_id), output_file)
+
+
+class BatchCompletions:
+    """
+    Structured completions served from the results of batch jobs.
+
+    A completion that has no result yet is queued as a batch request and
+    `CompletionDeferred` is raised, so a pipeline run stops at its first LLM
+    call and can be repeated once the job has finished. Requests are keyed
+    like the completion cache, so identical prompts are only sent once.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        temperature: Optional[float],
+        results: dict[str, dict[str, Any]],
+    ):
+        self.model = model
+        self.temperature = temperature
+        self.results = results
+        self.queued: dict[str, dict[str, Any]] = {}
+
+    def resolve(self, output_cls: type[BaseModel], prompt: str) -> str:
+        """Return the completion text for a prompt, or queue it and defer."""
+        custom_id = CompletionCache.make_key(
+            model=self.model,
+            temperature=self.temperature,
+            output_cls=output_cls,
+            prompt=prompt,
+        )
+        result = self.results.get(custom_id)
+        if result is None:
+            self.queued[custom_id] = make_batch_request(
+                custom_id, self.model, self.temperature, output_cls, prompt
+            )
+            raise CompletionDeferred(custom_id)
+        if "error" in result:
+            raise ValueError(f"Batch request {custom_id} failed: {result['error']}")
+
+        usage = result.get("usage") or {}
+        record_usage(
+            prompt=prompt,
+            completion=result["text"],
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+        )
+        return result["text"]
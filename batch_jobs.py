@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+from batch_backends import (
+    TERMINAL_STATUSES,
+    BatchBackend,
+    BatchCompletions,
+    CompletionDeferred,
+    LocalBatchBackend,
+    OpenAIBatchBackend,
+    parse_batch_output,
+)
+from clients import SharedClients, create_shared_clients
+from config import BATCH_CONCURRENCY, BATCH_JOB_DIR, BATCH_POLL_INTERVAL
+from constants import VARIANT_MAP
+from ics_anomaly_explainer import ICSAnomalyExplainer
+from models import ExperimentResult, ExperimentVariant
+
+load_dotenv()
+
+
+logger = logging.getLogger(__name__)
+
+
+STATE_FILE = "state.json"
+
+
+def load_state(work_dir: str) -> dict[str, Any]:
+    """Load the resume state of a batch job run, or start a new one."""
+    path = os.path.join(work_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {"results": {}, "batch_id": None, "jobs": 0, "saved": [], "failed": []}
+    with open(path, "r") as f:
+        state = json.load(f)
+    state.setdefault("failed", [])
+    return state
+
+
+def save_state(work_dir: str, state: dict[str, Any]) -> None:
+    """Atomically write the resume state, so an interrupted write keeps the old one."""
+    path = os.path.join(work_dir, STATE_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def clear_state(work_dir: str) -> None:
+    """Remove the resume state of a finished run, so the next run starts anew."""
+    path = os.path.join(work_dir, STATE_FILE)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def wait_for_batch(
+    backend: BatchBackend, batch_id: str, poll_interval: float
+) -> str:
+    """Poll a submitted batch job until it reaches a terminal status."""
+    while True:
+        status = await asyncio.to_thread(backend.status, batch_id)
+        if status in TERMINAL_STATUSES:
+            return status
+        logger.info(f"Batch job {batch_id} is {status}")
+        await asyncio.sleep(poll_interval)
+
+
+async def arun_batch_job(
+    attack_ids: list[int],
+    variants: list[ExperimentVariant],
+    output_dir: str,
+    backend: BatchBackend,
+    work_dir: str = BATCH_JOB_DIR,
+    poll_interval: float = BATCH_POLL_INTERVAL,
+    concurrency: int = BATCH_CONCURRENCY,
+    clients: Optional[SharedClients] = None,
+) -> list[ExperimentResult]:
+    """
+    Generate explanations for every (attack, variant) pair through batch jobs.
+
+    Each pass runs the pending pairs until their first LLM call without a
+    result, collects those calls into a JSONL job file and submits it. FULL
+    needs its MITRE inference before its explanation prompt can be built, so
+    a full run takes two jobs: the inferences and the other variants'
+    explanations, then the FULL explanations. Results are fanned back into
+    per-pair `ExperimentResult` files. Progress is kept in a state file in
+    `work_dir`, so an interrupted run resumes by polling the job it submitted.
+    Pairs that fail are not run again in the same call, but are retried when
+    an interrupted run resumes. The state file is removed when a run finishes.
+
+    Args:
+        attack_ids (list[int]): Attack IDs to explain.
+        variants (list[ExperimentVariant]): Variants to run for each attack.
+        output_dir (str): Directory of the results store to append to.
+        backend (BatchBackend): Service that runs the job files.
+        work_dir (str): Directory for job files, outputs and the state file.
+        poll_interval (float): Seconds between status checks of a job.
+        concurrency (int): Maximum number of pairs running at once in a pass.
+        clients (Optional[SharedClients]): Clients to reuse; created if omitted.
+
+    Returns:
+        list[ExperimentResult]: Results of the pairs completed by this call.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    state = load_state(work_dir)
+    # Failures of an earlier, interrupted call are retried. Batch requests
+    # that came back with an error are dropped, so they are queued again.
+    state["failed"] = []
+    state["results"] = {
+        custom_id: result
+        for custom_id, result in state["results"].items()
+        if "error" not in result
+    }
+    clients = clients or create_shared_clients()
+    semaphore = asyncio.Semaphore(concurrency)
+    completed = []
+
+    async def run_pair(
+        explainer: ICSAnomalyExplainer,
+    ) -> Optional[ExperimentResult]:
+        async with semaphore:
+            try:
+                return await explainer.arun_experiment()
+            except CompletionDeferred:
+                return None
+
+    while True:
+        if state["batch_id"] is not None:
+            batch_id = state["batch_id"]
+            status = await wait_for_batch(backend, batch_id, poll_interval)
+            if status != "completed":
+                raise RuntimeError(f"Batch job {batch_id} ended with status {status}")
+            output_file = os.path.join(work_dir, f"{batch_id}.output.jsonl")
+            await asyncio.to_thread(backend.download, batch_id, output_file)
+            state["results"].update(parse_batch_output(output_file))
+            state["batch_id"] = None
+            save_state(work_dir, state)
+
+        batch_completions = BatchCompletions(
+            model=clients.llm.metadata.model_name,
+            temperature=getattr(clients.llm, "temperature", None),
+            results=state["results"],
+        )
+        pass_clients = dataclasses.replace(clients, batch_completions=batch_completions)
+        explainers = []
+        for attack_id in attack_ids:
+            shared_stages = {}
+            for variant in variants:
+                pair = f"{attack_id}_{variant.value}"
+                if pair not in state["saved"] and pair not in state["failed"]:
+                    explainers.append(
+                        ICSAnomalyExplainer(
+                            variant,
+                            attack_id,
+                            clients=pass_clients,
+                            shared_stages=shared_stages,
+                        )
+                    )
+        results = await asyncio.gather(
+            *(run_pair(explainer) for explainer in explainers),
+            return_exceptions=True,
+        )
+
+        for explainer, result in zip(explainers, results):
+            pair = f"{explainer.attack_id}_{explainer.variant.value}"
+            if isinstance(result, BaseException):
+                logger.error(
+                    f"Error running experiment for attack {explainer.attack_id} "
+                    f"with variant {explainer.variant.value}",
+                    exc_info=result,
+                )
+                state["failed"].append(pair)
+            elif result is not None:
+                explainer.save_results(output_dir, result)
+                completed.append(result)
+                state["saved"].append(pair)
+        save_state(work_dir, state)
+
+        if not batch_completions.queued:
+            if state["failed"]:
+                logger.warning(f"Failed pairs: {', '.join(state['failed'])}")
+            clear_state(work_dir)
+            return completed
+
+        state["jobs"] += 1
+        job_file = os.path.join(work_dir, f"job-{state['jobs']}.jsonl")
+        with open(job_file, "w") as f:
+            for request in batch_completions.queued.values():
+                f.write(json.dumps(request) + "\n")
+        state["batch_id"] = await asyncio.to_thread(backend.submit, job_file)
+        save_state(work_dir, state)
+        logger.info(
+            f"Submitted {len(batch_completions.queued)} requests from {job_file} "
+            f"as batch job {state['batch_id']}"
+        )
+
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(
+        description="Generate ICS anomaly explanations offline through batch jobs"
+    )
+    parser.add_argument(
+        "--attacks", type=int, nargs="+", required=True, help="Attack IDs to process"
+    )
+    parser.add_argument(
+        "--variants",
+        type=str,
+        nargs="+",
+        default=["BASELINE", "NO_MITRE", "FULL"],
+        choices=list(VARIANT_MAP),
+        help="Experiment variants to run for each attack",
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        default="openai",
+        choices=["openai", "local"],
+        help="Batch backend; 'local' answers with empty placeholders for dry runs",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=str,
+        default=BATCH_JOB_DIR,
+        help="Directory for job files and the resume state",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=BATCH_POLL_INTERVAL,
+        help="Seconds between status checks of a submitted job",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="output/experiment-results/",
+        help="Output directory for results",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.backend == "local":
+        backend = LocalBatchBackend(args.work_dir)
+    else:
+        backend = OpenAIBatchBackend()
+    variants = [VARIANT_MAP[variant] for variant in args.variants]
+    results = asyncio.run(
+        arun_batch_job(
+            args.attacks,
+            variants,
+            args.output_dir,
+            backend,
+            work_dir=args.work_dir,
+            poll_interval=args.poll_interval,
+        )
+    )
+    logger.info(f"Completed {len(results)} experiments")
+
+
+if __name__ == "__main__":
+    # Setup logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from clients import SharedClients, create_shared_clients
+from config import BATCH_CONCURRENCY
+from constants import VARIANT_MAP
+from ics_anomaly_explainer import arun_variants
+from models import ExperimentResult, ExperimentVariant
+
+load_dotenv()
+
+
+logger = logging.getLogger(__name__)
+
+
+async def run_batch(
+    attack_ids: list[int],
+    variants: list[ExperimentVariant],
+    output_dir: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    clients: Optional[SharedClients] = None,
+) -> list[ExperimentResult]:
+    """
+    Run every attack concurrently with a bounded number in flight.
+
+    The variants of one attack run together through `arun_variants`, so the
+    stages they have in common are only executed once.
+
+    Args:
+        attack_ids (list[int]): Attack IDs to explain.
+        variants (list[ExperimentVariant]): Variants to run for each attack.
+        output_dir (str): Directory of the results store to append to.
+        concurrency (int): Maximum number of attacks running at once.
+        clients (Optional[SharedClients]): Clients to reuse; created if omitted.
+
+    Returns:
+        list[ExperimentResult]: Results of the pairs that completed successfully.
+    """
+    clients = clients or create_shared_clients()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_attack(attack_id: int) -> list[ExperimentResult]:
+        async with semaphore:
+            logger.info(
+                f"Experiments for attack {attack_id} with variants "
+                f"{', '.join(variant.value for variant in variants)}"
+            )
+            return await arun_variants(attack_id, variants, clients, output_dir)
+
+    results = await asyncio.gather(*(run_attack(attack_id) for attack_id in attack_ids))
+    return [result for attack_results in results for result in attack_results]
+
+
+def main():
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(
+        description="Run ICS anomaly explanation experiments for many attacks at once"
+    )
+    parser.add_argument(
+        "--attacks", type=int, nargs="+", required=True, help="Attack IDs to process"
+    )
+    parser.add_argument(
+        "--variants",
+        type=str,
+        nargs="+",
+        default=["BASELINE", "NO_MITRE", "FULL"],
+        choices=list(VARIANT_MAP),
+        help="Experiment variants to run for each attack",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BATCH_CONCURRENCY,
+        help="Maximum number of attacks running at once, each with all its "
+        "variants (not the number of attack and variant pairs)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="output/experiment-results/",
+        help="Output directory for results",
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    variants = [VARIANT_MAP[variant] for variant in args.variants]
+    results = asyncio.run(
+        run_batch(args.attacks, variants, args.output_dir, args.concurrency)
+    )
+    logger.info(
+        f"Completed {len(results)} of {len(args.attacks) * len(variants)} experiments"
+    )
+
+
+if __name__ == "__main__":
+    # Setup logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
@@ -0,0 +1,355 @@
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import tempfile
+import timeit
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+import process_attributions
+from constants import MITRE_TACTICS
+from ics_anomaly_explainer import ICSAnomalyExplainer
+from process_anomalies import (
+    calculate_stats,
+    compute_anomaly_statistics,
+    compute_feature_statistics,
+)
+from prompts import EXPLANATION_PROMPT, MITRE_FILTER_INFERENCE
+
+logger = logging.getLogger(__name__)
+
+
+BENCHMARK_DIR = "output/benchmarks/"
+SEED = 42
+
+# The 51 SWaT features; MV, P and UV are actuators, the rest are sensors.
+SWAT_FEATURES = (
+    "FIT101 LIT101 MV101 P101 P102 AIT201 AIT202 AIT203 FIT201 MV201 P201 P202 "
+    "P203 P204 P205 P206 DPIT301 FIT301 LIT301 MV301 MV302 MV303 MV304 P301 P302 "
+    "AIT401 AIT402 FIT401 LIT401 P401 P402 P403 P404 UV401 AIT501 AIT502 AIT503 "
+    "AIT504 FIT501 FIT502 FIT503 FIT504 P501 P502 PIT501 PIT502 PIT503 FIT601 "
+    "P601 P602 P603"
+).split()
+ACTUATOR_PREFIXES = ("MV", "P", "UV")
+
+# rows: length of the test dataset (the SWaT test set has ~450k rows)
+# window: detection points per attack
+# attacks: explanation files read by the attribution functions
+# context_nodes: retrieved chunks in the explanation prompt
+SCALES = {
+    "small": {"rows": 10_000, "window": 300, "attacks": 32, "context_nodes": 6},
+    "medium": {"rows": 100_000, "window": 3_000, "attacks": 320, "context_nodes": 12},
+    "large": {"rows": 450_000, "window": 30_000, "attacks": 3_200, "context_nodes": 24},
+}
+
+
+def is_actuator(feature: str) -> bool:
+    return feature.startswith(ACTUATOR_PREFIXES) and not feature.startswith("PIT")
+
+
+@dataclass
+class SyntheticData:
+    """Synthetic SWaT-like inputs for one scale."""
+
+    test_dataset: pd.DataFrame
+    detection_points: np.ndarray
+    explanations_dir: str
+    attack_stats: dict[str, Any]
+    context: str
+
+
+def generate_data(scale: dict[str, int], work_dir: str, seed: int) -> SyntheticData:
+    """Generate a test dataset, a detection window and explanation files."""
+    rng = np.random.default_rng(seed)
+    rows = scale["rows"]
+    columns = {}
+    for feature in SWAT_FEATURES:
+        if is_actuator(feature):
+            columns[feature] = rng.integers(0, 3, size=rows)
+        else:
+            columns[feature] = rng.normal(500, 50, size=rows)
+    test_dataset = pd.DataFrame(columns)
+    test_dataset.insert(
+        0, "Timestamp", pd.date_range("2015-12-28 10:00:00", periods=rows, freq="s")
+    )
+
+    # Detection points are a sparse subset of a window in the second half.
+    window_start = int(rng.integers(rows // 2, rows - 2 * scale["window"]))
+    detection_points = np.sort(
+        rng.choice(
+            np.arange(window_start, window_start + 2 * scale["window"]),
+            size=scale["window"],
+            replace=False,
+        )
+    )
+
+    explanations_dir = os.path.join(work_dir, "explanations")
+    os.makedirs(explanations_dir, exist_ok=True)
+    for attack_number in range(scale["attacks"]):
+        scores = np.sort(rng.exponential(10, size=len(SWAT_FEATURES)))[::-1]
+        features = rng.permutation(SWAT_FEATURES)
+        attributions = [
+            {"feature": str(feature), "score": float(score)}
+            for feature, score in zip(features, scores)
+        ]
+        # Some attacks have NaN scores in the real explanations.
+        if attack_number % 10 == 9:
+            attributions[0]["score"] = math.nan
+        explanation = {
+            "attributions": attributions,
+            "true_label": str(features[int(rng.integers(0, 5))]),
+        }
+        with open(
+            os.path.join(explanations_dir, f"attack_{attack_number}.json"), "w"
+        ) as f:
+            json.dump(explanation, f)
+
+    top_statistics = compute_anomaly_statistics(
+        detection_points, test_dataset, SWAT_FEATURES[1]
+    )
+    attack_stats = {
+        "baseline_stats": top_statistics["baseline_stats"],
+        "anomaly_stats": top_statistics["detected_stats"],
+        "change_percentage": top_statistics["detected_change_percent"],
+    }
+    chunk = "The component regulates flow between process stages. " * 15
+    context = "\n---\n".join(
+        f"Source Type: component\n{chunk}" for _ in range(scale["context_nodes"])
+    )
+    return SyntheticData(
+        test_dataset=test_dataset,
+        detection_points=detection_points,
+        explanations_dir=explanations_dir,
+        attack_stats=attack_stats,
+        context=context,
+    )
+
+
+@contextmanager
+def explanations_from(directory: str, num_attacks: int) -> Iterator[None]:
+    """Point the attribution functions at synthetic explanation files."""
+    saved = process_attributions.EXPLANATIONS_DIR, process_attributions.NUM_ATTACKS
+    process_attributions.EXPLANATIONS_DIR = directory
+    process_attributions.NUM_ATTACKS = num_attacks
+    try:
+        yield
+    finally:
+        process_attributions.EXPLANATIONS_DIR, process_attributions.NUM_ATTACKS = saved
+
+
+def benchmark_cases(data: SyntheticData) -> dict[str, Callable[[], Any]]:
+    """The benchmarked functions, bound to the inputs of one scale."""
+    top_feature = SWAT_FEATURES[1]
+    detected_values = data.test_dataset.iloc[data.detection_points][top_feature].values
+    # The explainer helpers only read `attack_stats`, so they are called on a
+    # stand-in instead of an explainer with clients.
+    explainer = SimpleNamespace(attack_stats=data.attack_stats)
+    get_heuristic_filters = (
+        ICSAnomalyExplainer._ICSAnomalyExplainer__get_heuristic_filters
+    )
+    attack_stats_to_prompt = (
+        ICSAnomalyExplainer._ICSAnomalyExplainer__attack_stats_to_prompt
+    )
+    anomaly_stats = attack_stats_to_prompt(explainer)
+
+    return {
+        "calculate_stats": lambda: calculate_stats(detected_values),
+        "compute_anomaly_statistics": lambda: compute_anomaly_statistics(
+            data.detection_points, data.test_dataset, top_feature
+        ),
+        "compute_feature_statistics": lambda: compute_feature_statistics(
+            data.detection_points, data.test_dataset, SWAT_FEATURES[:5]
+        ),
+        "heuristic_filters": lambda: [
+            get_heuristic_filters(explainer, feature) for feature in SWAT_FEATURES
+        ],
+        "attack_stats_to_prompt": lambda: attack_stats_to_prompt(explainer),
+        "format_mitre_prompt": lambda: MITRE_FILTER_INFERENCE.format(
+            top_feature=top_feature, context=data.context, MITRE_TACTICS=MITRE_TACTICS
+        ),
+        "format_explanation_prompt": lambda: EXPLANATION_PROMPT.format(
+            top_feature=top_feature, context=data.context, anomaly_stats=anomaly_stats
+        ),
+        "compute_match_for_k_attributions": lambda: (
+            process_attributions.compute_match_for_k_attributions(5)
+        ),
+        "process_top_k_attributions": lambda: (
+            process_attributions.process_top_k_attributions(5)
+        ),
+    }
+
+
+def measure(function: Callable[[], Any], repeat: int) -> dict[str, Any]:
+    """
+    Time a function, in seconds per call.
+
+    Each of the `repeat` samples runs the function enough times to take at
+    least 0.2 seconds, so fast functions are not dominated by timer overhead.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    samples = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(
+    scales: list[str],
+    repeat: int,
+    seed: int,
+    selected: Optional[list[str]] = None,
+) -> dict[str, Any]:
+    """Run the benchmarks at each scale and return the results document."""
+    results = []
+    for scale_name in scales:
+        scale = SCALES[scale_name]
+        with tempfile.TemporaryDirectory() as work_dir:
+            logger.info(f"Generating {scale_name} data: {scale}")
+            data = generate_data(scale, work_dir, seed)
+            with explanations_from(data.explanations_dir, scale["attacks"]):
+                for name, function in benchmark_cases(data).items():
+                    if selected and name not in selected:
+                        continue
+                    timing = measure(function, repeat)
+                    logger.info(
+                        f"{name} [{scale_name}]: "
+                        f"{timing['median'] * 1e6:.1f}µs median"
+                    )
+                    results.append(
+                        {"benchmark": name, "scale": scale_name, **scale, **timing}
+                    )
+    return {
+        "metadata": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare_results(
+    baseline: dict[str, Any], current: dict[str, Any], threshold: float
+) -> list[tuple[str, str, float]]:
+    """
+    Log the fastest time of each benchmark against a baseline run.
+
+    The minimum is compared rather than the median, since it is the sample
+    least affected by other load on the machine.
+
+    Returns:
+        list: (benchmark, scale, ratio) of benchmarks slower than `threshold`
+        times the baseline.
+    """
+    baseline_times = {
+        (result["benchmark"], result["scale"]): result["min"]
+        for result in baseline["results"]
+    }
+    regressions = []
+    logger.info(
+        f"{'benchmark':<34} {'scale':<8} {'baseline':>12} {'current':>12} {'ratio':>7}"
+    )
+    for result in current["results"]:
+        key = (result["benchmark"], result["scale"])
+        if key not in baseline_times:
+            continue
+        ratio = result["min"] / baseline_times[key]
+        flag = " slower" if ratio > threshold else ""
+        logger.info(
+            f"{key[0]:<34} {key[1]:<8} {baseline_times[key] * 1e6:>10.1f}µs "
+            f"{result['min'] * 1e6:>10.1f}µs {ratio:>6.2f}x{flag}"
+        )
+        if ratio > threshold:
+            regressions.append((key[0], key[1], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the local processing steps on synthetic data"
+    )
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        choices=list(SCALES),
+        default=["small", "medium"],
+        help="Data scales to benchmark at",
+    )
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        default=None,
+        help="Names of the benchmarks to run (default: all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Timing samples per benchmark"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=SEED, help="Seed of the synthetic data"
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help=f"Results file (default: a timestamped file in {BENCHMARK_DIR})",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Results file of an earlier run to compare against",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="Ratio to the earlier run above which a benchmark counts as slower",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.repeat, args.seed, args.benchmarks)
+
+    output_path = args.output or os.path.join(
+        BENCHMARK_DIR, f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Results written to {output_path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} benchmark(s) slower than baseline")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
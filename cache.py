@@ -0,0 +1,353 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Optional
+
+from llama_cloud import MetadataFilters
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from pydantic import BaseModel
+
+from models import TacticsOutput
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, accessed_at);
+"""
+
+
+def canonical_hash(payload: Any) -> str:
+    """Hash a JSON-serialisable payload independently of dict key order."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def canonical_filters(filters: Optional[MetadataFilters]) -> Optional[dict]:
+    """
+    Convert metadata filters into a canonical form for hashing.
+
+    AND/OR conditions are commutative and IN/NIN values are sets, so both are
+    sorted to make equivalent filters hash to the same key.
+    """
+    if filters is None:
+        return None
+
+    def normalise(node: dict) -> dict:
+        if "filters" in node:
+            children = [normalise(child) for child in node["filters"]]
+            return {
+                "condition": node.get("condition"),
+                "filters": sorted(children, key=canonical_hash),
+            }
+        value = node.get("value")
+        if isinstance(value, list):
+            value = sorted(value, key=str)
+        return {"key": node["key"], "operator": node["operator"], "value": value}
+
+    return normalise(json.loads(filters.json()))
+
+
+def nodes_to_json(nodes: list[NodeWithScore]) -> str:
+    """Serialise retrieved nodes and their scores."""
+    return json.dumps(
+        [{"node": doc_to_json(node.node), "score": node.score} for node in nodes]
+    )
+
+
+def nodes_from_json(value: str) -> list[NodeWithScore]:
+    """Deserialise nodes written by `nodes_to_json`."""
+    return [
+        NodeWithScore(node=json_to_doc(item["node"]), score=item["score"])
+        for item in json.loads(value)
+    ]
+
+
+class DiskCache:
+    """
+    Persistent key-value cache stored in SQLite, with LRU, TTL and size limits.
+
+    Each operation opens its own connection, so one cache file can be shared by
+    threads and processes. WAL mode lets readers proceed while a writer holds
+    the lock, and writers wait on each other for up to `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        timeout: float = 30.0,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self.__connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def __connect(self) -> sqlite3.Connection:
+        # Autocommit mode; transactions are opened explicitly where needed.
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def __is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached value for a key, or None on a miss or expiry."""
+        now = time.time()
+        with closing(self.__connect()) as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.__is_expired(created_at, now):
+                conn.execute(
+                    "DELETE FROM entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                return None
+            conn.execute(
+                "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        """Store a value and evict entries that exceed the configured limits."""
+        now = time.time()
+        with closing(self.__connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, value, len(value.encode()), now, now),
+                )
+                self.__evict(conn, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def __evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then least recently used ones over the limits."""
+        if self.ttl_seconds is not None:
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND created_at < ?",
+                (self.namespace, now - self.ttl_seconds),
+            )
+        if self.max_entries is not None:
+            conn.execute(
+                """
+                DELETE FROM entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM entries WHERE namespace = ?
+                    ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_entries),
+            )
+        if self.max_bytes is not None:
+            conn.execute(
+                """
+                DELETE FROM entries WHERE namespace = ? AND key IN (
+                    SELECT key FROM (
+                        SELECT key, SUM(size) OVER (
+                            ORDER BY accessed_at DESC, key
+                        ) AS running_size
+                        FROM entries WHERE namespace = ?
+                    ) WHERE running_size > ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_bytes),
+            )
+
+    def clear(self) -> None:
+        """Remove every entry in this cache's namespace."""
+        with closing(self.__connect()) as conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+
+class RetrievalCache:
+    """Cache of retrieved `NodeWithScore` results keyed by query and filters."""
+
+    def __init__(self, cache: DiskCache, knowledge_base_version: str):
+        self.cache = cache
+        self.knowledge_base_version = knowledge_base_version
+
+    def make_key(
+        self, query: str, filters: Optional[MetadataFilters], **params: Any
+    ) -> str:
+        """Build a canonical key from the query, filters and retrieval parameters."""
+        return canonical_hash(
+            {
+                "knowledge_base_version": self.knowledge_base_version,
+                "query": query,
+                "filters": canonical_filters(filters),
+                "params": params,
+            }
+        )
+
+    def get(self, key: str) -> Optional[list[NodeWithScore]]:
+        value = self.cache.get(key)
+        return nodes_from_json(value) if value is not None else None
+
+    def set(self, key: str, nodes: list[NodeWithScore]) -> None:
+        self.cache.set(key, nodes_to_json(nodes))
+
+
+class CompletionCache:
+    """Content-addressed cache of structured LLM completions."""
+
+    def __init__(self, cache: DiskCache):
+        self.cache = cache
+
+    @staticmethod
+    def make_key(
+        model: str,
+        temperature: Optional[float],
+        output_cls: type[BaseModel],
+        prompt: str,
+    ) -> str:
+        """Build a key from the model settings, output schema and prompt hash."""
+        return canonical_hash(
+            {
+                "model": model,
+                "temperature": temperature,
+                "output_schema": output_cls.model_json_schema(),
+                "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            }
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def set(self, key: str, text: str) -> None:
+        self.cache.set(key, text)
+
+
+class MitreInferenceMemo:
+    """
+    Memo of MITRE tactic inference and technique retrieval per component.
+
+    The inference only depends on the component and the SWaT context retrieved
+    for it, so both the `TacticsOutput` and the MITRE nodes retrieved with it
+    are reused for repeated anomalies on the same component. Entries are keyed
+    by the knowledge base version, so bumping it invalidates every entry.
+    """
+
+    def __init__(self, cache: DiskCache, knowledge_base_version: str):
+        self.cache = cache
+        self.knowledge_base_version = knowledge_base_version
+
+    def make_key(self, component: str, context: str, model: str) -> str:
+        """Build a key from the component, a hash of its context and the model."""
+        return canonical_hash(
+            {
+                "knowledge_base_version": self.knowledge_base_version,
+                "component": component,
+                "context": hashlib.sha256(context.encode("utf-8")).hexdigest(),
+                "model": model,
+            }
+        )
+
+    def get(self, key: str) -> Optional[tuple[TacticsOutput, list[NodeWithScore]]]:
+        value = self.cache.get(key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return (
+            TacticsOutput.model_validate(entry["inference"]),
+            nodes_from_json(entry["nodes"]),
+        )
+
+    def set(
+        self, key: str, inference: TacticsOutput, nodes: list[NodeWithScore]
+    ) -> None:
+        self.cache.set(
+            key,
+            json.dumps(
+                {"inference": inference.model_dump(), "nodes": nodes_to_json(nodes)}
+            ),
+        )
+
+
+class TacticHistory:
+    """
+    Tactics inferred so far per component, for speculative MITRE retrieval.
+
+    Each component keeps a count of every tactic set inferred for it, with the
+    reasoning last inferred for that set; the counts of single tactics over
+    all components are kept too. Entries are keyed by the knowledge base
+    version and the model, since both shape the inferences. Updates are
+    unlocked read-modify-writes, so concurrent writers may lose an update,
+    which only weakens a prediction.
+    """
+
+    ALL_COMPONENTS = "*"
+
+    def __init__(self, cache: DiskCache, knowledge_base_version: str, model: str):
+        self.cache = cache
+        self.knowledge_base_version = knowledge_base_version
+        self.model = model
+
+    def __key(self, component: str) -> str:
+        return f"{self.knowledge_base_version}/{self.model}/{component}"
+
+    def __load(self, component: str) -> dict[str, Any]:
+        value = self.cache.get(self.__key(component))
+        return json.loads(value) if value is not None else {"counts": {}}
+
+    def record(self, component: str, tactics: list[str], reasoning: str) -> None:
+        if not tactics:
+            return
+        tactic_set = "|".join(sorted(tactics))
+        entry = self.__load(component)
+        entry["counts"][tactic_set] = entry["counts"].get(tactic_set, 0) + 1
+        entry.setdefault("reasoning", {})[tactic_set] = reasoning
+        self.cache.set(self.__key(component), json.dumps(entry))
+
+        overall = self.__load(self.ALL_COMPONENTS)
+        for tactic in tactics:
+            overall["counts"][tactic] = overall["counts"].get(tactic, 0) + 1
+        self.cache.set(self.__key(self.ALL_COMPONENTS), json.dumps(overall))
+
+    def predict(
+        self, component: str, k: int = 3
+    ) -> Optional[tuple[list[str], Optional[str]]]:
+        """
+        Predict the tactics of the next inference for a component.
+
+        Returns:
+            Optional[tuple[list[str], Optional[str]]]: The component's most
+            frequent tactic set and its reasoning, else the `k` most frequent
+            tactics overall without reasoning, or None without any history.
+        """
+        entry = self.__load(component)
+        if entry["counts"]:
+            tactic_set = max(entry["counts"], key=entry["counts"].get)
+            return tactic_set.split("|"), entry["reasoning"][tactic_set]
+        overall = self.__load(self.ALL_COMPONENTS)["counts"]
+        if overall:
+            return sorted(overall, key=overall.get, reverse=True)[:k], None
+        return None
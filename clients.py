@@ -0,0 +1,301 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Optional, Union
+
+import httpx
+
+from cache import (
+    CompletionCache,
+    DiskCache,
+    MitreInferenceMemo,
+    RetrievalCache,
+    TacticHistory,
+)
+from config import (
+    CACHE_FILE,
+    COMPLETION_CACHE_ENABLED,
+    COMPLETION_CACHE_MAX_BYTES,
+    COMPLETION_CACHE_MAX_ENTRIES,
+    COMPLETION_CACHE_TTL_SECONDS,
+    KNOWLEDGE_BASE_VERSION,
+    LLAMA_CLOUD_TIMEOUT,
+    LLAMA_INDEX_NAME,
+    LLAMA_PROJECT_NAME,
+    LLM_BACKEND,
+    LLM_HEDGING,
+    LOCAL_INDEX_DIR,
+    MITRE_MEMO_ENABLED,
+    MITRE_MEMO_MAX_ENTRIES,
+    OPENAI_MODEL,
+    OPENAI_TEMPERATURE,
+    RATE_LIMIT_ENABLED,
+    RESILIENCE_ENABLED,
+    RETRIEVAL_BACKEND,
+    RETRIEVAL_CACHE_ENABLED,
+    RETRIEVAL_CACHE_MAX_BYTES,
+    RETRIEVAL_CACHE_MAX_ENTRIES,
+    RETRIEVAL_CACHE_TTL_SECONDS,
+    RETRIEVAL_HEDGING,
+    SPECULATIVE_RETRIEVAL_ENABLED,
+    TACTIC_HISTORY_MAX_ENTRIES,
+    TACTIC_INDEX_DIR,
+)
+from rate_limits import RateLimitScheduler
+from resilience import ResiliencePolicy
+from stats_store import AnomalyStatsStore
+from token_counting import get_tokenizer
+from tracing import span
+
+# The LLM, LlamaCloud and local index modules are slow to import, so they are
+# imported where the clients are created; see `LazyClient` and `warm_up`.
+if TYPE_CHECKING:
+    from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
+    from llama_index.llms.openai import OpenAI
+
+    from batch_backends import BatchCompletions
+    from local_index import LocalHybridIndex
+    from mock_backends import MockIndex, MockLLM
+    from tactic_index import TacticIndex
+
+logger = logging.getLogger(__name__)
+
+
+# Cached retrievals and memoized inferences depend on the backend that served them.
+KNOWLEDGE_BASE_ID = f"{RETRIEVAL_BACKEND}-{KNOWLEDGE_BASE_VERSION}"
+
+
+class LazyClient:
+    """
+    Proxy that creates a client on first attribute access.
+
+    Creation is guarded by a lock, so `warm_up` can create the client in a
+    background thread while the first pipeline stage runs, and a stage that
+    needs it sooner waits for that creation instead of starting another.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+@dataclass
+class SharedClients:
+    """Network clients and caches shared by every explainer in a process."""
+
+    index: Union["LlamaCloudIndex", "LocalHybridIndex", "MockIndex"]
+    llm: Union["OpenAI", "MockLLM", LazyClient]
+    retrieval_cache: Optional[RetrievalCache] = None
+    completion_cache: Optional[CompletionCache] = None
+    mitre_memo: Optional[MitreInferenceMemo] = None
+    tactic_index: Optional["TacticIndex"] = None
+    batch_completions: Optional["BatchCompletions"] = None  # Offline batch mode only
+    anomaly_stats: Optional[AnomalyStatsStore] = None
+    retrieval_policy: Optional[ResiliencePolicy] = None
+    llm_policy: Optional[ResiliencePolicy] = None
+    rate_limiter: Optional[RateLimitScheduler] = None
+    tactic_history: Optional[TacticHistory] = None
+
+
+def create_index(
+    httpx_client: Optional[httpx.Client] = None,
+    async_httpx_client: Optional[httpx.AsyncClient] = None,
+) -> Union["LlamaCloudIndex", "LocalHybridIndex", "MockIndex"]:
+    """Create the knowledge base index for the configured retrieval backend."""
+    if RETRIEVAL_BACKEND == "local":
+        from local_index import LocalHybridIndex
+
+        return LocalHybridIndex.load(LOCAL_INDEX_DIR)
+    elif RETRIEVAL_BACKEND == "mock":
+        from mock_backends import MockIndex
+
+        return MockIndex()
+    elif RETRIEVAL_BACKEND != "llama_cloud":
+        raise ValueError(f"Unknown retrieval backend: {RETRIEVAL_BACKEND}")
+
+    from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
+
+    return LlamaCloudIndex(
+        LLAMA_INDEX_NAME,
+        project_name=LLAMA_PROJECT_NAME,
+        api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
+        timeout=LLAMA_CLOUD_TIMEOUT,
+        httpx_client=httpx_client,
+        async_httpx_client=async_httpx_client,
+    )
+
+
+def create_llm() -> Union["OpenAI", "MockLLM"]:
+    """Create the configured LLM, with its token usage counted per request."""
+    from llama_index.core.callbacks import CallbackManager
+
+    from token_counting import RequestTokenCountingHandler
+
+    callback_manager = CallbackManager([RequestTokenCountingHandler()])
+    if LLM_BACKEND == "mock":
+        from mock_backends import MockLLM
+
+        return MockLLM(callback_manager=callback_manager)
+    elif LLM_BACKEND != "openai":
+        raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}")
+
+    from llama_index.llms.openai import OpenAI
+
+    return OpenAI(
+        model=OPENAI_MODEL,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        temperature=OPENAI_TEMPERATURE,
+        callback_manager=callback_manager,
+        # Retries are left to the resilience policy, so they are not repeated
+        # inside each of its attempts.
+        **({"max_retries": 0} if RESILIENCE_ENABLED else {}),
+    )
+
+
+def create_retrieval_cache() -> Optional[RetrievalCache]:
+    """Create the persistent retrieval cache, if enabled in the config."""
+    # The local index answers faster than a cache lookup, so it is not cached,
+    # and mock retrievals are not cached so that their latency is measured.
+    if not RETRIEVAL_CACHE_ENABLED or RETRIEVAL_BACKEND in ("local", "mock"):
+        return None
+    return RetrievalCache(
+        DiskCache(
+            CACHE_FILE,
+            namespace="retrieval",
+            max_entries=RETRIEVAL_CACHE_MAX_ENTRIES,
+            max_bytes=RETRIEVAL_CACHE_MAX_BYTES,
+            ttl_seconds=RETRIEVAL_CACHE_TTL_SECONDS,
+        ),
+        knowledge_base_version=KNOWLEDGE_BASE_ID,
+    )
+
+
+def create_completion_cache() -> Optional[CompletionCache]:
+    """Create the persistent structured completion cache, if enabled in the config."""
+    # Mock completions are not cached, so that their latency is measured.
+    if not COMPLETION_CACHE_ENABLED or LLM_BACKEND == "mock":
+        return None
+    return CompletionCache(
+        DiskCache(
+            CACHE_FILE,
+            namespace="completion",
+            max_entries=COMPLETION_CACHE_MAX_ENTRIES,
+            max_bytes=COMPLETION_CACHE_MAX_BYTES,
+            ttl_seconds=COMPLETION_CACHE_TTL_SECONDS,
+        )
+    )
+
+
+def create_mitre_memo() -> Optional[MitreInferenceMemo]:
+    """Create the per-component MITRE inference memo, if enabled in the config."""
+    # Neither are mock inferences, for the same reason.
+    if not MITRE_MEMO_ENABLED or LLM_BACKEND == "mock":
+        return None
+    return MitreInferenceMemo(
+        DiskCache(CACHE_FILE, namespace="mitre", max_entries=MITRE_MEMO_MAX_ENTRIES),
+        knowledge_base_version=KNOWLEDGE_BASE_ID,
+    )
+
+
+def create_tactic_history() -> Optional[TacticHistory]:
+    """Create the tactic history for speculative MITRE retrieval, if enabled."""
+    # Mock inferences are not recorded, as they would predict live ones.
+    if not SPECULATIVE_RETRIEVAL_ENABLED or LLM_BACKEND == "mock":
+        return None
+    return TacticHistory(
+        DiskCache(
+            CACHE_FILE,
+            namespace="tactic_history",
+            max_entries=TACTIC_HISTORY_MAX_ENTRIES,
+        ),
+        knowledge_base_version=KNOWLEDGE_BASE_ID,
+        model=OPENAI_MODEL,
+    )
+
+
+def create_resilience_policies() -> (
+    tuple[Optional[ResiliencePolicy], Optional[ResiliencePolicy]]
+):
+    """Create the retrieval and LLM resilience policies, if enabled in the config."""
+    if not RESILIENCE_ENABLED:
+        return None, None
+    return (
+        ResiliencePolicy(f"{RETRIEVAL_BACKEND} retrieval", hedging=RETRIEVAL_HEDGING),
+        ResiliencePolicy(f"{LLM_BACKEND} LLM", hedging=LLM_HEDGING),
+    )
+
+
+def load_tactic_index() -> Optional["TacticIndex"]:
+    """Load the offline tactic index for the FULL_FAST variant, if it was built."""
+    from tactic_index import TacticIndex
+
+    try:
+        return TacticIndex.load(TACTIC_INDEX_DIR)
+    except FileNotFoundError:
+        return None
+
+
+def create_shared_clients() -> SharedClients:
+    """
+    Create the index and LLM clients once for a batch of runs.
+
+    Every retriever created from the index reuses the same connection pools.
+    The async pool binds to the event loop that first uses it, so a set of
+    shared clients should not be reused across separate `asyncio.run` calls.
+    The LLM is only needed after the first retrieval, so it is created on
+    first use (see `warm_up`).
+    """
+    with span(
+        "clients.create", retrieval_backend=RETRIEVAL_BACKEND, llm_backend=LLM_BACKEND
+    ):
+        retrieval_policy, llm_policy = create_resilience_policies()
+        return SharedClients(
+            index=create_index(
+                httpx_client=httpx.Client(timeout=LLAMA_CLOUD_TIMEOUT),
+                async_httpx_client=httpx.AsyncClient(timeout=LLAMA_CLOUD_TIMEOUT),
+            ),
+            llm=LazyClient(create_llm),
+            retrieval_cache=create_retrieval_cache(),
+            completion_cache=create_completion_cache(),
+            mitre_memo=create_mitre_memo(),
+            tactic_index=load_tactic_index(),
+            anomaly_stats=AnomalyStatsStore.open(),
+            retrieval_policy=retrieval_policy,
+            llm_policy=llm_policy,
+            rate_limiter=RateLimitScheduler() if RATE_LIMIT_ENABLED else None,
+            tactic_history=create_tactic_history(),
+        )
+
+
+def warm_up(clients: SharedClients) -> threading.Thread:
+    """
+    Create the lazy LLM client and load the tokenizer in a background thread.
+
+    Started before the first stage, the imports and tokenizer loading overlap
+    with the first retrieval's network round trip instead of delaying it.
+    """
+
+    def run() -> None:
+        try:
+            if isinstance(clients.llm, LazyClient):
+                clients.llm.get()
+            get_tokenizer()
+        except Exception:
+            # Raised again where the client or tokenizer is first needed.
+            logger.debug("Warm-up failed", exc_info=True)
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -1,10 +1,120 @@
 # Project Data Files
 ANOMALY_STATS_FILE = "output/anomaly_statistics.json"
+# Indexed copy of ANOMALY_STATS_FILE, rebuilt automatically when it changes
+ANOMALY_STATS_DB = "output/anomaly_statistics.sqlite3"
 
 # LLM Configuration
+# "openai", or "mock" for the offline fake LLM in mock_backends.py
+LLM_BACKEND = "openai"
 OPENAI_MODEL = "gpt-4o-mini"
 OPENAI_TEMPERATURE = 0.2
 
+# Prices in USD per million tokens, by model, for the costs computed by
+# aggregate_results.py.
+TOKEN_PRICES_PER_MILLION = {
+    "gpt-4o-mini": {"input": 0.25, "output": 0.60},
+    "mock-llm": {"input": 0.0, "output": 0.0},
+}
+
+# Tokenizer Configuration
+# tiktoken caches its BPE files here instead of the system temp directory, so
+# runs work offline once `python token_counting.py` has fetched them.
+TIKTOKEN_CACHE_DIR = "data/tiktoken-cache/"
+
 # Index Configuration
+# "llama_cloud" for the managed LlamaCloud index, "local" for the in-process
+# hybrid index built with `python local_index.py`, or "mock" for the offline
+# fake retriever in mock_backends.py.
+RETRIEVAL_BACKEND = "llama_cloud"
+LOCAL_INDEX_DIR = "data/local-index/"
+TACTIC_INDEX_DIR = "data/tactic-index/"
 LLAMA_INDEX_NAME = "ICS Knowledge Base"
 LLAMA_PROJECT_NAME = "Default"
+LLAMA_CLOUD_TIMEOUT = 60
+# Bump whenever documents are added to or changed in the index, to invalidate
+# cached retrievals and memoized MITRE inferences.
+KNOWLEDGE_BASE_VERSION = "1"
+
+# Context Configuration
+# Maximum tokens of retrieved context in the explanation prompt, after
+# duplicate chunks are removed; lower-scoring chunks are left out first.
+# None disables the limit.
+CONTEXT_TOKEN_BUDGET = 1024
+
+# Tracing Configuration
+TRACING_ENABLED = False  # Also enabled per run with --trace
+TRACE_FILE = "output/traces.jsonl"  # OTLP/JSON spans, one export request per line
+
+# Mock Backend Configuration
+# Latencies in seconds, as {"distribution": ..., **parameters} with one of
+# "constant" (value), "uniform" (low, high), "normal" (mean, std) or
+# "lognormal" (median, sigma). Samples are drawn from a seeded generator, so
+# mock runs are repeatable.
+MOCK_SEED = 0
+MOCK_LLM_TIME_TO_FIRST_TOKEN = {
+    "distribution": "lognormal",
+    "median": 0.4,
+    "sigma": 0.5,
+}
+MOCK_LLM_SECONDS_PER_TOKEN = 0.01  # Output generation time per completion token
+MOCK_RETRIEVAL_LATENCY = {"distribution": "lognormal", "median": 0.3, "sigma": 0.4}
+MOCK_CHARS_PER_TOKEN = 4  # Token counts of the mock LLM are estimated from length
+
+# Resilience Configuration
+# Retrieval and LLM requests slower than HEDGE_PERCENTILE of recent requests
+# of the same kind get a backup request, and the first response is used.
+# Hedging starts once HEDGE_MIN_SAMPLES latencies have been observed.
+RESILIENCE_ENABLED = True
+RETRIEVAL_HEDGING = True
+LLM_HEDGING = False  # A hedged completion may be billed twice
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200  # Recent latencies kept per kind of request
+MAX_RETRIES = 3  # Of connection errors, timeouts, 429s and 5xx responses
+RETRY_BASE_DELAY = 0.5  # Seconds, doubled per retry, with full jitter
+RETRY_MAX_DELAY = 8
+CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before a backend fails fast
+CIRCUIT_RESET_SECONDS = 30  # Before a trial request is let through again
+STAGE_DEADLINE_SECONDS = 120  # None disables the per-stage deadline
+
+# Rate Limit Configuration
+# Request and token limits per minute of the OpenAI account. LLM requests
+# wait for budget under these limits instead of being rejected with 429s.
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_REQUESTS_PER_MINUTE = 500
+RATE_LIMIT_TOKENS_PER_MINUTE = 200_000
+RATE_LIMIT_COMPLETION_TOKENS = 400  # Initial estimate, corrected from counted usage
+
+# Batch Configuration
+BATCH_CONCURRENCY = 8
+BATCH_JOB_DIR = "data/batch-jobs/"  # Job files and resume state of offline batch jobs
+BATCH_POLL_INTERVAL = 60  # Seconds between status checks of a submitted batch job
+BATCH_COMPLETION_WINDOW = "24h"
+
+# Cache Configuration
+CACHE_FILE = "data/cache/cache.sqlite3"
+RETRIEVAL_CACHE_ENABLED = True
+RETRIEVAL_CACHE_MAX_ENTRIES = 10_000
+RETRIEVAL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RETRIEVAL_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+COMPLETION_CACHE_ENABLED = True
+COMPLETION_CACHE_MAX_ENTRIES = 10_000
+COMPLETION_CACHE_MAX_BYTES = 256 * 1024 * 1024
+COMPLETION_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+MITRE_MEMO_ENABLED = True
+MITRE_MEMO_MAX_ENTRIES = 10_000
+
+# Speculation Configuration
+# When enabled, FULL starts the MITRE technique retrieval for the tactics most
+# often inferred for the component while the inference is still running, and
+# uses its result if the inferred tactics are the same. Components without
+# history use the most often inferred tactics overall, or these defaults at
+# first. The speculative query is an earlier reasoning, not the current one,
+# so it is recorded in the stage metrics as `speculative_query`.
+SPECULATIVE_RETRIEVAL_ENABLED = False
+SPECULATIVE_DEFAULT_TACTICS = [
+    "Impair Process Control",
+    "Inhibit Response Function",
+    "Impact",
+]
+TACTIC_HISTORY_MAX_ENTRIES = 10_000
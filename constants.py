@@ -4,6 +4,7 @@ VARIANT_MAP = {
     "BASELINE": ExperimentVariant.BASELINE,
     "NO_MITRE": ExperimentVariant.NO_MITRE,
     "FULL": ExperimentVariant.FULL,
+    "FULL_FAST": ExperimentVariant.FULL_FAST,
 }
 
 MITRE_TACTICS = [
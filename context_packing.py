@@ -0,0 +1,102 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from llama_index.core.schema import NodeWithScore
+
+CONTEXT_SEPARATOR = "\n---\n"
+
+
+def format_node(node: NodeWithScore) -> str:
+    """Format a retrieved node as one block of the explanation context."""
+    return f"Source Type: {node.metadata.get('doc_type', 'Unknown')}\n{node.text}"
+
+
+def content_hash(node: NodeWithScore) -> str:
+    return hashlib.sha256(node.text.strip().encode("utf-8")).hexdigest()
+
+
+def deduplicate_nodes(nodes: list[NodeWithScore]) -> list[NodeWithScore]:
+    """
+    Drop nodes with the same ID or the same text as an earlier one.
+
+    Of each group of duplicates, the highest-scoring node is kept at the
+    position of the first one.
+    """
+    positions: dict[str, int] = {}
+    unique: list[NodeWithScore] = []
+    for node in nodes:
+        keys = (f"id:{node.node.node_id}", f"text:{content_hash(node)}")
+        position = next((positions[key] for key in keys if key in positions), None)
+        if position is None:
+            position = len(unique)
+            unique.append(node)
+        elif (node.score or 0.0) > (unique[position].score or 0.0):
+            unique[position] = node
+        for key in keys:
+            positions[key] = position
+    return unique
+
+
+@dataclass
+class PackedContext:
+    """Context selected for a prompt and what was left out of it."""
+
+    nodes: list[NodeWithScore]
+    text: str
+    tokens: int
+    tokens_saved: int  # Tokens of the unpacked context minus `tokens`
+    duplicates_removed: int
+    nodes_dropped: int  # Unique nodes left out to fit the token budget
+
+
+def pack_context(
+    nodes: list[NodeWithScore],
+    encode: Callable[[str], list[int]],
+    token_budget: Optional[int] = None,
+) -> PackedContext:
+    """
+    Deduplicate nodes and fit their context into a token budget.
+
+    Nodes are admitted in order of decreasing score while they fit, so a
+    large low-scoring chunk is skipped in favour of smaller ones that still
+    fit. Admitted nodes keep their retrieval order in the context.
+
+    Args:
+        nodes (list[NodeWithScore]): Retrieved nodes, in retrieval order.
+        encode (Callable[[str], list[int]]): Tokenizer used to count tokens.
+        token_budget (Optional[int]): Maximum context tokens; None for no limit.
+
+    Returns:
+        PackedContext: The selected nodes, their context and token savings.
+    """
+    unique = deduplicate_nodes(nodes)
+    blocks = [format_node(node) for node in unique]
+    block_tokens = [len(encode(block)) for block in blocks]
+    separator_tokens = len(encode(CONTEXT_SEPARATOR))
+
+    selected = set(range(len(unique)))
+    if token_budget is not None:
+        selected = set()
+        used = 0
+        by_score = sorted(
+            range(len(unique)), key=lambda i: unique[i].score or 0.0, reverse=True
+        )
+        for i in by_score:
+            cost = block_tokens[i] + (separator_tokens if selected else 0)
+            if used + cost <= token_budget:
+                selected.add(i)
+                used += cost
+
+    packed_nodes = [node for i, node in enumerate(unique) if i in selected]
+    text = CONTEXT_SEPARATOR.join(blocks[i] for i in sorted(selected))
+    tokens = len(encode(text))
+    unpacked_tokens = len(encode(CONTEXT_SEPARATOR.join(map(format_node, nodes))))
+    return PackedContext(
+        nodes=packed_nodes,
+        text=text,
+        tokens=tokens,
+        tokens_saved=unpacked_tokens - tokens,
+        duplicates_removed=len(nodes) - len(unique),
+        nodes_dropped=len(unique) - len(packed_nodes),
+    )
@@ -1,11 +1,11 @@
+import asyncio
 import json
 import logging
-import os
 import time
-from dataclasses import asdict
-from typing import Optional
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import AsyncIterator, Callable, Optional
 
-import tiktoken
 from llama_cloud import (
     FilterCondition,
     FilterOperator,
@@ -13,19 +13,20 @@ from llama_cloud import (
     MetadataFilters,
     RetrievalMode,
 )
-from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
+from llama_index.core.callbacks import TokenCountingHandler
+from llama_index.core.prompts import PromptTemplate
 from llama_index.core.schema import NodeWithScore
-from llama_index.indices.managed.llama_cloud import LlamaCloudIndex
-from llama_index.llms.openai import OpenAI
+from pydantic import BaseModel
 
+from cache import CompletionCache, canonical_filters, canonical_hash
+from clients import SharedClients, create_shared_clients
 from config import (
-    ANOMALY_STATS_FILE,
-    LLAMA_INDEX_NAME,
-    LLAMA_PROJECT_NAME,
-    OPENAI_MODEL,
-    OPENAI_TEMPERATURE,
+    CONTEXT_TOKEN_BUDGET,
+    SPECULATIVE_DEFAULT_TACTICS,
+    STAGE_DEADLINE_SECONDS,
 )
 from constants import MITRE_TACTICS
+from context_packing import pack_context
 from models import (
     ExperimentResult,
     ExperimentVariant,
@@ -34,56 +35,132 @@ from models import (
     TacticsOutput,
 )
 from prompts import EXPLANATION_PROMPT, MITRE_FILTER_INFERENCE
+from resilience import CallStats, call_with, deadline
+from results_store import ResultsStore
+from stats_store import AnomalyStatsStore
+from token_counting import count_tokens, current_usage, get_tokenizer
+from tracing import current_span, span
 
 
 class ICSAnomalyExplainer:
     """Main class for ICS anomaly explanation pipeline."""
 
-    def __init__(self, variant: ExperimentVariant, attack_id: int):
+    def __init__(
+        self,
+        variant: ExperimentVariant,
+        attack_id: int,
+        clients: Optional[SharedClients] = None,
+        shared_stages: Optional[dict[str, asyncio.Task]] = None,
+    ):
         self.logger = logging.getLogger(__name__)
         self.variant = variant
         self.attack_id = attack_id
-        with open(ANOMALY_STATS_FILE, "r") as f:
-            anomaly_stats = json.load(f)[self.attack_id]
-            self.top_feature = anomaly_stats["top_attribution"]
-            self.attack_stats = {
-                "baseline_stats": anomaly_stats["baseline_stats"],
-                "anomaly_stats": anomaly_stats["detected_stats"],
-                "change_percentage": anomaly_stats["detected_change_percent"],
-            }
-
-        self.token_counter = TokenCountingHandler(
-            tokenizer=tiktoken.encoding_for_model(OPENAI_MODEL).encode
-        )
-        self.llm = OpenAI(
-            model=OPENAI_MODEL,
-            api_key=os.getenv("OPENAI_API_KEY"),
-            temperature=OPENAI_TEMPERATURE,
-            callback_manager=CallbackManager([self.token_counter]),
-        )
-        self.index = LlamaCloudIndex(
-            LLAMA_INDEX_NAME,
-            project_name=LLAMA_PROJECT_NAME,
-            api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
-        )
+
+        # Clients are shared across concurrent runs; token counts are kept per
+        # request by binding a counter around each stage (see token_counting).
+        clients = clients or create_shared_clients()
+
+        with span("anomaly_stats.load"):
+            stats_store = clients.anomaly_stats or AnomalyStatsStore.open()
+            anomaly_stats = stats_store.get(self.attack_id)
+        self.top_feature = anomaly_stats["top_attribution"]
+        self.attack_stats = {
+            "baseline_stats": anomaly_stats["baseline_stats"],
+            "anomaly_stats": anomaly_stats["detected_stats"],
+            "change_percentage": anomaly_stats["detected_change_percent"],
+        }
+        self.llm = clients.llm
+        self.index = clients.index
+        self.retrieval_cache = clients.retrieval_cache
+        self.completion_cache = clients.completion_cache
+        self.mitre_memo = clients.mitre_memo
+        self.tactic_index = clients.tactic_index
+        self.batch_completions = clients.batch_completions
+        self.retrieval_policy = clients.retrieval_policy
+        self.llm_policy = clients.llm_policy
+        self.rate_limiter = clients.rate_limiter
+        self.tactic_history = clients.tactic_history
+        # In-flight retrievals shared by the variants of one attack (see
+        # `arun_variants`), keyed by query, filters and retrieval parameters.
+        self.shared_stages = shared_stages
         self.nodes: list[NodeWithScore] = []
         self.stages: list[StageMetrics] = []
+        self.cache_hits = 0
+        self.shared = False
+        self.context_tokens_saved = 0
+        self.hedged_requests = 0
+        self.retries = 0
+        self.rate_limit_wait = 0.0
+        self.speculative_hit: Optional[bool] = None
+        self.speculation_saved = 0.0
+        self.speculative_query: Optional[str] = None
+        self.time_to_first_token: Optional[float] = None
+        self.field_latencies: dict[str, float] = {}
 
     def __add_stage_metrics(
-        self, stage_name: str, latency: float, retrieved_docs: int = 0
+        self,
+        stage_name: str,
+        latency: float,
+        token_counter: Optional[TokenCountingHandler] = None,
+        retrieved_docs: int = 0,
     ):
-        """Helper method to add stage metrics."""
-        self.stages.append(
-            StageMetrics(
-                stage_name=stage_name,
-                latency_seconds=latency,
-                embedding_tokens=self.token_counter.total_embedding_token_count,
-                input_tokens=self.token_counter.prompt_llm_token_count,
-                output_tokens=self.token_counter.completion_llm_token_count,
-                retrieved_docs=retrieved_docs,
-            )
+        """Helper method to add stage metrics, mirrored on the current stage span."""
+        stage = StageMetrics(
+            stage_name=stage_name,
+            latency_seconds=latency,
+            embedding_tokens=(
+                token_counter.total_embedding_token_count if token_counter else 0
+            ),
+            input_tokens=(token_counter.prompt_llm_token_count if token_counter else 0),
+            output_tokens=(
+                token_counter.completion_llm_token_count if token_counter else 0
+            ),
+            retrieved_docs=retrieved_docs,
+            cache_hits=self.cache_hits,
+            shared=self.shared,
+            context_tokens_saved=self.context_tokens_saved,
+            hedged_requests=self.hedged_requests,
+            retries=self.retries,
+            rate_limit_wait=self.rate_limit_wait,
+            speculative_hit=self.speculative_hit,
+            speculation_saved=self.speculation_saved,
+            speculative_query=self.speculative_query,
+            time_to_first_token=self.time_to_first_token,
+            field_latencies=self.field_latencies or None,
         )
-        self.token_counter.reset_counts()
+        self.stages.append(stage)
+        stage_span = current_span()
+        if stage_span is not None:
+            stage_span.set_attributes(
+                input_tokens=stage.input_tokens,
+                output_tokens=stage.output_tokens,
+                retrieved_docs=stage.retrieved_docs,
+                cache_hits=stage.cache_hits,
+                shared=stage.shared,
+                context_tokens_saved=stage.context_tokens_saved,
+                hedged_requests=stage.hedged_requests,
+                retries=stage.retries,
+                rate_limit_wait=stage.rate_limit_wait,
+                speculative_hit=stage.speculative_hit,
+                speculation_saved=stage.speculation_saved,
+                time_to_first_token=stage.time_to_first_token,
+            )
+        self.cache_hits = 0
+        self.shared = False
+        self.context_tokens_saved = 0
+        self.hedged_requests = 0
+        self.retries = 0
+        self.rate_limit_wait = 0.0
+        self.speculative_hit = None
+        self.speculation_saved = 0.0
+        self.speculative_query = None
+        self.time_to_first_token = None
+        self.field_latencies = {}
+
+    def __add_call_stats(self, call_stats: CallStats) -> None:
+        """Count the hedged requests and retries of a call toward the current stage."""
+        self.hedged_requests += call_stats.hedged_requests
+        self.retries += call_stats.retries
 
     def __get_heuristic_filters(self, top_feature: str) -> MetadataFilters:
         """Generate metadata filters based on the top attribution feature."""
@@ -102,36 +179,298 @@ class ICSAnomalyExplainer:
                 break
         return MetadataFilters(filters=filters, condition=FilterCondition.OR)
 
-    def __retrieve_documents(
-        self, query: str, filters: Optional[MetadataFilters] = None, top_k: int = 3
+    async def __aretrieve_documents(
+        self,
+        query: str,
+        kind: str,
+        filters: Optional[MetadataFilters] = None,
+        top_k: int = 3,
     ) -> list[NodeWithScore]:
-        """Retrieve document chunks from the index."""
-        retriever = self.index.as_retriever(
+        """
+        Retrieve document chunks from the index.
+
+        Retrievals of one `kind` share latency percentiles for hedging.
+        Identical retrievals already started by another variant of the same
+        attack are awaited instead of issued again.
+        """
+        retriever_kwargs = dict(
             retrieval_mode=RetrievalMode.CHUNKS,
             dense_similarity_top_k=top_k,
             sparse_similarity_top_k=top_k,
             alpha=0.5,
             enable_reranking=True,
             rerank_top_n=top_k,
-            filters=filters,
         )
-        return retriever.retrieve(query)
+        if self.shared_stages is None:
+            nodes, cached = await self.__afetch_documents(
+                query, kind, filters, retriever_kwargs
+            )
+        else:
+            stage_key = canonical_hash(
+                {
+                    "query": query,
+                    "filters": canonical_filters(filters),
+                    "params": retriever_kwargs,
+                }
+            )
+            task = self.shared_stages.get(stage_key)
+            if task is None:
+                task = asyncio.ensure_future(
+                    self.__afetch_documents(query, kind, filters, retriever_kwargs)
+                )
+                self.shared_stages[stage_key] = task
+            else:
+                self.shared = True
+            # Shielded so that one variant being cancelled does not cancel the
+            # retrieval for the others waiting on it.
+            nodes, cached = await asyncio.shield(task)
+        if cached:
+            self.cache_hits += 1
+        return nodes
 
-    def __infer_mitre_filters(
-        self, top_feature: str, swat_nodes: list[NodeWithScore]
-    ) -> tuple[MetadataFilters, str]:
-        """Infer MITRE ATT&CK filters based on the top attribution feature."""
-        context = "\n".join([node.text for node in swat_nodes])
-        prompt = MITRE_FILTER_INFERENCE.format(
-            top_feature=top_feature,
-            context=context,
-            MITRE_TACTICS=MITRE_TACTICS,
-        )
-        response = self.llm.as_structured_llm(output_cls=TacticsOutput).complete(
-            prompt=prompt,
+    async def __afetch_documents(
+        self,
+        query: str,
+        kind: str,
+        filters: Optional[MetadataFilters],
+        retriever_kwargs: dict,
+    ) -> tuple[list[NodeWithScore], bool]:
+        """Retrieve from the cache or the index, and whether it was a cache hit."""
+        if self.retrieval_cache is not None:
+            with span("retrieval_cache.get") as cache_span:
+                cache_key = self.retrieval_cache.make_key(
+                    query, filters, **retriever_kwargs
+                )
+                cached_nodes = await asyncio.to_thread(
+                    self.retrieval_cache.get, cache_key
+                )
+                cache_span.set_attribute("hit", cached_nodes is not None)
+            if cached_nodes is not None:
+                return cached_nodes, True
+
+        # Reranking happens server-side for LlamaCloud, so it is part of this span.
+        with span(
+            "retrieval.request", query=query, filtered=filters is not None
+        ) as request_span:
+            retriever = self.index.as_retriever(filters=filters, **retriever_kwargs)
+            nodes, call_stats = await call_with(
+                self.retrieval_policy,
+                lambda: retriever.aretrieve(query),
+                kind=kind,
+            )
+            self.__add_call_stats(call_stats)
+            request_span.set_attribute("retrieved_docs", len(nodes))
+
+        if self.retrieval_cache is not None:
+            with span("retrieval_cache.set"):
+                await asyncio.to_thread(self.retrieval_cache.set, cache_key, nodes)
+        return nodes, False
+
+    async def __areserve_tokens(
+        self, kind: str, prompt: str
+    ) -> Optional[tuple[int, int]]:
+        """
+        Wait for rate limit budget for an LLM request.
+
+        Returns:
+            Optional[tuple[int, int]]: The prompt's tokens and the tokens
+            reserved for the request, or None without a rate limiter.
+        """
+        if self.rate_limiter is None:
+            return None
+        prompt_tokens = len(get_tokenizer()(prompt))
+        estimated_tokens = self.rate_limiter.estimate(kind, prompt_tokens)
+        with span("rate_limit.acquire", estimated_tokens=estimated_tokens) as wait_span:
+            waited = await self.rate_limiter.acquire(
+                str(self.attack_id), estimated_tokens
+            )
+            wait_span.set_attribute("wait_seconds", waited)
+        self.rate_limit_wait += waited
+        return prompt_tokens, estimated_tokens
+
+    @asynccontextmanager
+    async def __rate_limited(self, kind: str, prompt: str) -> AsyncIterator[None]:
+        """
+        Send one LLM request within the rate limits.
+
+        Entered for every attempt of a call, so retries and hedged backups
+        each wait for budget. A failed or cancelled attempt keeps its whole
+        reservation, since the provider may have counted it.
+        """
+        reservation = await self.__areserve_tokens(kind, prompt)
+        counted_before = current_usage()
+        yield
+        self.__settle_tokens(kind, reservation, counted_before)
+
+    def __settle_tokens(
+        self,
+        kind: str,
+        reservation: Optional[tuple[int, int]],
+        counted_before: tuple[int, int],
+    ) -> None:
+        """Correct the rate limit budget with the tokens counted for a request."""
+        if reservation is None:
+            return
+        prompt_tokens, estimated_tokens = reservation
+        counted_prompt, counted_completion = current_usage()
+        self.rate_limiter.settle(
+            kind,
+            prompt_tokens=prompt_tokens,
+            estimated_tokens=estimated_tokens,
+            counted_prompt_tokens=counted_prompt - counted_before[0],
+            counted_completion_tokens=counted_completion - counted_before[1],
         )
-        output = TacticsOutput.model_validate(json.loads(response.text))
-        filters = MetadataFilters(
+
+    def __emit_fields(
+        self,
+        output: BaseModel,
+        start_index: int,
+        end_index: int,
+        start_time: float,
+        on_field: Callable[[str, str], None],
+    ) -> None:
+        """Report completed output fields in schema order and record their latency."""
+        for name in list(type(output).model_fields)[start_index:end_index]:
+            self.field_latencies[name] = time.perf_counter() - start_time
+            on_field(name, getattr(output, name))
+
+    async def __astream_structured(
+        self,
+        output_cls: type[BaseModel],
+        prompt: str,
+        start_time: float,
+        on_field: Callable[[str, str], None],
+    ) -> str:
+        """Stream a structured completion, reporting each field once it is complete."""
+        field_names = list(output_cls.model_fields)
+        # The prompt is already formatted, so braces in the context are escaped.
+        template = PromptTemplate(prompt.replace("{", "{{").replace("}", "}}"))
+        stream = await self.llm.astream_structured_predict(output_cls, template)
+        emitted = 0
+        partial = None
+        async for partial in stream:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = time.perf_counter() - start_time
+            # Fields are generated in schema order, so a field is complete as
+            # soon as the model has started writing a later one.
+            started = [
+                index
+                for index, name in enumerate(field_names)
+                if getattr(partial, name, None)
+            ]
+            if started and max(started) > emitted:
+                self.__emit_fields(partial, emitted, max(started), start_time, on_field)
+                emitted = max(started)
+        if partial is None:
+            raise ValueError("Streaming completion returned no output")
+        output = output_cls.model_validate(partial.model_dump())
+        self.__emit_fields(output, emitted, len(field_names), start_time, on_field)
+        return output.model_dump_json()
+
+    async def __arequest_completion(
+        self,
+        output_cls: type[BaseModel],
+        prompt: str,
+        start_time: float,
+        on_field: Optional[Callable[[str, str], None]],
+    ) -> str:
+        """Request a structured completion from the LLM within the rate limits."""
+        kind = output_cls.__name__
+        admission = None
+        if self.rate_limiter is not None:
+            admission = partial(self.__rate_limited, kind, prompt)
+        if on_field is None:
+            response, call_stats = await call_with(
+                self.llm_policy,
+                lambda: self.llm.as_structured_llm(output_cls=output_cls).acomplete(
+                    prompt=prompt
+                ),
+                kind=kind,
+                admission=admission,
+            )
+            self.__add_call_stats(call_stats)
+            response_text = response.text
+        else:
+            # Fields already passed to `on_field` cannot be taken back, so a
+            # stream is neither hedged nor retried.
+            response_text, _ = await call_with(
+                self.llm_policy,
+                lambda: self.__astream_structured(
+                    output_cls, prompt, start_time, on_field
+                ),
+                hedge=False,
+                retry=False,
+                admission=admission,
+            )
+        return response_text
+
+    async def __acomplete_structured(
+        self,
+        output_cls: type[BaseModel],
+        prompt: str,
+        on_field: Optional[Callable[[str, str], None]] = None,
+        start_time: Optional[float] = None,
+    ) -> str:
+        """
+        Complete a prompt into the output schema, serving repeats from cache.
+
+        When `on_field` is given, the completion is streamed and each output
+        field is passed to it as soon as it is complete. The time to the first
+        token and to each field are measured from `start_time`, the start of
+        the stage, which defaults to now.
+        """
+        if start_time is None:
+            start_time = time.perf_counter()
+        if self.completion_cache is not None:
+            with span("completion_cache.get") as cache_span:
+                cache_key = CompletionCache.make_key(
+                    model=self.llm.metadata.model_name,
+                    temperature=getattr(self.llm, "temperature", None),
+                    output_cls=output_cls,
+                    prompt=prompt,
+                )
+                cached_text = await asyncio.to_thread(
+                    self.completion_cache.get, cache_key
+                )
+                cache_span.set_attribute("hit", cached_text is not None)
+            if cached_text is not None:
+                self.cache_hits += 1
+                if on_field is not None:
+                    self.time_to_first_token = time.perf_counter() - start_time
+                    output = output_cls.model_validate(json.loads(cached_text))
+                    self.__emit_fields(
+                        output, 0, len(output_cls.model_fields), start_time, on_field
+                    )
+                return cached_text
+
+        with span(
+            "llm.request",
+            model=self.llm.metadata.model_name,
+            output_schema=output_cls.__name__,
+            prompt_chars=len(prompt),
+            streamed=on_field is not None,
+        ):
+            if self.batch_completions is not None:
+                # Offline batch mode: served from a finished batch job, or
+                # queued for the next one by raising CompletionDeferred.
+                response_text = self.batch_completions.resolve(output_cls, prompt)
+            else:
+                response_text = await self.__arequest_completion(
+                    output_cls, prompt, start_time, on_field
+                )
+
+        # Batch results may be placeholders of a dry run, so only responses
+        # from a live provider are cached.
+        if self.completion_cache is not None and self.batch_completions is None:
+            with span("completion_cache.set"):
+                await asyncio.to_thread(
+                    self.completion_cache.set, cache_key, response_text
+                )
+        return response_text
+
+    def __get_mitre_filters(self, tactics: list[str]) -> MetadataFilters:
+        """Generate metadata filters for the MITRE ATT&CK techniques of the tactics."""
+        return MetadataFilters(
             filters=[
                 MetadataFilter(
                     key="source", operator=FilterOperator.EQUAL_TO, value="MITRE_ICS"
@@ -141,13 +480,158 @@ class ICSAnomalyExplainer:
                     operator=FilterOperator.EQUAL_TO,
                     value="attack_technique",
                 ),
-                MetadataFilter(
-                    key="tactic", operator=FilterOperator.IN, value=output.tactics
-                ),
+                MetadataFilter(key="tactic", operator=FilterOperator.IN, value=tactics),
             ],
             condition=FilterCondition.AND,
         )
-        return filters, output.reasoning
+
+    async def __ainfer_mitre_filters(
+        self, top_feature: str, swat_nodes: list[NodeWithScore]
+    ) -> tuple[MetadataFilters, TacticsOutput]:
+        """Infer MITRE ATT&CK filters based on the top attribution feature."""
+        context = "\n".join([node.text for node in swat_nodes])
+        prompt = MITRE_FILTER_INFERENCE.format(
+            top_feature=top_feature,
+            context=context,
+            MITRE_TACTICS=MITRE_TACTICS,
+        )
+        response_text = await self.__acomplete_structured(TacticsOutput, prompt)
+        with span("parse", output_schema="TacticsOutput"):
+            output = TacticsOutput.model_validate(json.loads(response_text))
+        return self.__get_mitre_filters(output.tactics), output
+
+    async def __aretrieve_mitre_documents(
+        self, top_feature: str, swat_nodes: list[NodeWithScore]
+    ) -> tuple[list[NodeWithScore], str]:
+        """Infer MITRE tactics and retrieve their techniques, reusing memoized runs."""
+        if self.mitre_memo is not None:
+            memo_key = self.mitre_memo.make_key(
+                component=top_feature,
+                context="\n".join([node.text for node in swat_nodes]),
+                model=self.llm.metadata.model_name,
+            )
+            with span("mitre_memo.get") as memo_span:
+                memoized = await asyncio.to_thread(self.mitre_memo.get, memo_key)
+                memo_span.set_attribute("hit", memoized is not None)
+            if memoized is not None:
+                self.cache_hits += 1
+                inference, mitre_nodes = memoized
+                return mitre_nodes, inference.reasoning
+
+        speculation = await self.__start_speculative_retrieval(top_feature)
+        try:
+            filters, inference = await self.__ainfer_mitre_filters(
+                top_feature=top_feature, swat_nodes=swat_nodes
+            )
+        except BaseException:
+            if speculation is not None:
+                speculation[2].cancel()
+            raise
+        mitre_nodes = None
+        if speculation is not None:
+            mitre_nodes = await self.__finish_speculative_retrieval(
+                speculation, inference.tactics
+            )
+        if mitre_nodes is None:
+            mitre_nodes = await self.__aretrieve_documents(
+                query=inference.reasoning, kind="mitre", filters=filters
+            )
+        if self.tactic_history is not None and self.batch_completions is None:
+            await asyncio.to_thread(
+                self.tactic_history.record,
+                top_feature,
+                inference.tactics,
+                inference.reasoning,
+            )
+
+        # Techniques retrieved with an earlier reasoning are not memoized with
+        # the current inference.
+        if (
+            self.mitre_memo is not None
+            and self.batch_completions is None
+            and self.speculative_query in (None, inference.reasoning)
+        ):
+            await asyncio.to_thread(
+                self.mitre_memo.set, memo_key, inference, mitre_nodes
+            )
+        return mitre_nodes, inference.reasoning
+
+    async def __start_speculative_retrieval(
+        self, top_feature: str
+    ) -> Optional[tuple[set[str], str, asyncio.Task]]:
+        """
+        Start retrieving MITRE techniques for the predicted tactics of a component.
+
+        The query is the reasoning last inferred for the predicted tactics, or
+        the component and tactics if there is none yet, since the reasoning of
+        the running inference is not known until it finishes.
+        """
+        if self.tactic_history is None:
+            return None
+        predicted = await asyncio.to_thread(self.tactic_history.predict, top_feature)
+        tactics, reasoning = predicted or (SPECULATIVE_DEFAULT_TACTICS, None)
+        query = reasoning or f"{top_feature}: {', '.join(tactics)}"
+
+        async def retrieve() -> tuple[list[NodeWithScore], float]:
+            start_time = time.perf_counter()
+            with span("speculative_retrieval", tactics=tactics):
+                nodes = await self.__aretrieve_documents(
+                    query=query,
+                    kind="mitre",
+                    filters=self.__get_mitre_filters(tactics),
+                )
+            return nodes, time.perf_counter() - start_time
+
+        return set(tactics), query, asyncio.ensure_future(retrieve())
+
+    async def __finish_speculative_retrieval(
+        self, speculation: tuple[set[str], str, asyncio.Task], tactics: list[str]
+    ) -> Optional[list[NodeWithScore]]:
+        """
+        Use the speculative retrieval if it was for the inferred tactics, and
+        record its query in `speculative_query`.
+
+        Returns:
+            Optional[list[NodeWithScore]]: The speculatively retrieved nodes,
+            or None if the prediction missed or the retrieval failed.
+        """
+        predicted_tactics, query, task = speculation
+        self.speculative_hit = predicted_tactics == set(tactics)
+        if not self.speculative_hit:
+            task.cancel()
+            # Retrieve any error, so that a failed retrieval is not reported.
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            return None
+        inferred_time = time.perf_counter()
+        try:
+            nodes, retrieval_latency = await task
+        except Exception:
+            self.logger.warning("Speculative MITRE retrieval failed", exc_info=True)
+            return None
+        # The part of the retrieval that overlapped with the inference.
+        self.speculation_saved = max(
+            0.0, retrieval_latency - (time.perf_counter() - inferred_time)
+        )
+        self.speculative_query = query
+        return nodes
+
+    def __rank_mitre_documents(
+        self, top_feature: str, swat_nodes: list[NodeWithScore], top_k: int = 3
+    ) -> tuple[list[NodeWithScore], str]:
+        """Rank MITRE tactics and techniques locally, without an LLM round trip."""
+        if self.tactic_index is None:
+            raise FileNotFoundError(
+                "FULL_FAST requires the tactic index; build it with tactic_index.py"
+            )
+        context = "\n".join([top_feature] + [node.text for node in swat_nodes])
+        with span("tactic_index.rank"):
+            ranked_tactics = self.tactic_index.rank_tactics(context, k=3)
+            tactics = [tactic for tactic, _ in ranked_tactics]
+            mitre_nodes = self.tactic_index.retrieve(context, tactics, top_k=top_k)
+        reasoning = f"Tactics ranked by similarity to the {top_feature} context: " + (
+            ", ".join(f"{tactic} ({score:.2f})" for tactic, score in ranked_tactics)
+        )
+        return mitre_nodes, reasoning
 
     def __attack_stats_to_prompt(self) -> str:
         """Convert attack statistics to a formatted string for the prompt."""
@@ -159,80 +643,150 @@ class ICSAnomalyExplainer:
 
         return f"Baseline: {baseline['mean']:.2f}±{baseline['std']:.2f} → Detected: {detected['mean']:.2f}±{detected['std']:.2f} ({change_direction}{self.attack_stats['change_percentage']}, {signature})"
 
-    def generate_explanation(self) -> tuple[str, ExplanationOutput]:
-        context = "\n---\n".join(
-            [
-                f"Source Type: {node.metadata.get('doc_type', 'Unknown')}\n{node.text}"
-                for node in self.nodes
-            ]
-        )
+    async def agenerate_explanation(
+        self, on_field: Optional[Callable[[str, str], None]] = None
+    ) -> tuple[str, ExplanationOutput]:
+        """
+        Generate the explanation from the retrieved context.
+
+        If `on_field` is given, the explanation is streamed and `on_field` is
+        called with each field name and value as soon as that field is complete.
+        """
+        start_time = time.perf_counter()
+        # SWaT and MITRE retrievals can overlap, so the context is deduplicated
+        # and fitted to the token budget; `self.nodes` keeps what was used.
+        with span("context_packing", input_nodes=len(self.nodes)) as packing_span:
+            with span("tokenizer.load"):
+                tokenizer = get_tokenizer()
+            packed = pack_context(self.nodes, tokenizer, CONTEXT_TOKEN_BUDGET)
+            packing_span.set_attributes(
+                context_tokens=packed.tokens,
+                tokens_saved=packed.tokens_saved,
+                duplicates_removed=packed.duplicates_removed,
+                nodes_dropped=packed.nodes_dropped,
+            )
+        self.nodes = packed.nodes
+        self.context_tokens_saved = packed.tokens_saved
         prompt = EXPLANATION_PROMPT.format(
             top_feature=self.top_feature,
-            context=context,
+            context=packed.text,
             anomaly_stats=self.__attack_stats_to_prompt(),
         )
-        response = self.llm.as_structured_llm(output_cls=ExplanationOutput).complete(
-            prompt=prompt
+        response_text = await self.__acomplete_structured(
+            ExplanationOutput, prompt, on_field=on_field, start_time=start_time
         )
-        output = ExplanationOutput.model_validate(json.loads(response.text))
+        with span("parse", output_schema="ExplanationOutput"):
+            output = ExplanationOutput.model_validate(json.loads(response_text))
         return prompt, output
 
-    def run_experiment(self) -> ExperimentResult:
-        """Run a complete experiment on a specific attack for a given variant."""
+    def generate_explanation(
+        self, on_field: Optional[Callable[[str, str], None]] = None
+    ) -> tuple[str, ExplanationOutput]:
+        """Blocking wrapper around `agenerate_explanation`."""
+        return asyncio.run(self.agenerate_explanation(on_field=on_field))
+
+    async def arun_experiment(
+        self, on_field: Optional[Callable[[str, str], None]] = None
+    ) -> ExperimentResult:
+        """
+        Run a complete experiment on a specific attack for a given variant.
+
+        If `on_field` is given, the explanation stage is streamed (see
+        `agenerate_explanation`).
+        """
+        with span(
+            "experiment", attack_id=self.attack_id, variant=self.variant.value
+        ) as experiment_span:
+            result = await self.__arun_stages(on_field)
+            experiment_span.set_attribute("total_latency", result.total_latency)
+            return result
+
+    async def __arun_stages(
+        self, on_field: Optional[Callable[[str, str], None]]
+    ) -> ExperimentResult:
+        """Run the pipeline stages, each in its own span, and collect the result."""
         total_start_time = time.perf_counter()
 
         # Step 1: Retrieve SWaT documents
         if (
             self.variant == ExperimentVariant.NO_MITRE
             or self.variant == ExperimentVariant.FULL
+            or self.variant == ExperimentVariant.FULL_FAST
         ):
             filters = self.__get_heuristic_filters(top_feature=self.top_feature)
         else:
             filters = None
-        retrieve_swat_start_time = time.perf_counter()
-        swat_doc_nodes = self.__retrieve_documents(
-            query=self.top_feature, filters=filters
-        )
-        retrieve_swat_latency = time.perf_counter() - retrieve_swat_start_time
-        self.nodes.extend(swat_doc_nodes)
-        self.__add_stage_metrics(
-            stage_name="swat_document_retrieval",
-            latency=retrieve_swat_latency,
-            retrieved_docs=len(swat_doc_nodes),
-        )
-
-        # Step 2: Retrieve MITRE ATT&CK tactics
-        if self.variant == ExperimentVariant.FULL:
-            retrieve_mitre_start_time = time.perf_counter()
-            filters, reasoning = self.__infer_mitre_filters(
-                top_feature=self.top_feature, swat_nodes=swat_doc_nodes
-            )
-            mitre_doc_nodes = self.__retrieve_documents(
-                query=reasoning, filters=filters
-            )
-            retrieve_mitre_latency = time.perf_counter() - retrieve_mitre_start_time
-            self.nodes.extend(mitre_doc_nodes)
-            self.__add_stage_metrics(
-                stage_name="mitre_document_retrieval",
-                latency=retrieve_mitre_latency,
-                retrieved_docs=len(mitre_doc_nodes),
-            )
-        else:
-            reasoning = None
+        with span("stage.swat_document_retrieval", filtered=filters is not None):
+            retrieve_swat_start_time = time.perf_counter()
+            with count_tokens() as token_counter:
+                async with deadline(STAGE_DEADLINE_SECONDS):
+                    swat_doc_nodes = await self.__aretrieve_documents(
+                        query=self.top_feature,
+                        kind="swat_filtered" if filters else "swat_unfiltered",
+                        filters=filters,
+                    )
+            retrieve_swat_latency = time.perf_counter() - retrieve_swat_start_time
+            self.nodes.extend(swat_doc_nodes)
             self.__add_stage_metrics(
-                stage_name="mitre_document_retrieval",
-                latency=0.0,
-                retrieved_docs=0,
+                stage_name="swat_document_retrieval",
+                latency=retrieve_swat_latency,
+                token_counter=token_counter,
+                retrieved_docs=len(swat_doc_nodes),
             )
 
+        # Step 2: Retrieve MITRE ATT&CK tactics
+        with span("stage.mitre_document_retrieval"):
+            if self.variant == ExperimentVariant.FULL:
+                retrieve_mitre_start_time = time.perf_counter()
+                with count_tokens() as token_counter:
+                    async with deadline(STAGE_DEADLINE_SECONDS):
+                        mitre_doc_nodes, reasoning = (
+                            await self.__aretrieve_mitre_documents(
+                                top_feature=self.top_feature, swat_nodes=swat_doc_nodes
+                            )
+                        )
+                retrieve_mitre_latency = time.perf_counter() - retrieve_mitre_start_time
+                self.nodes.extend(mitre_doc_nodes)
+                self.__add_stage_metrics(
+                    stage_name="mitre_document_retrieval",
+                    latency=retrieve_mitre_latency,
+                    token_counter=token_counter,
+                    retrieved_docs=len(mitre_doc_nodes),
+                )
+            elif self.variant == ExperimentVariant.FULL_FAST:
+                retrieve_mitre_start_time = time.perf_counter()
+                mitre_doc_nodes, reasoning = self.__rank_mitre_documents(
+                    top_feature=self.top_feature, swat_nodes=swat_doc_nodes
+                )
+                retrieve_mitre_latency = time.perf_counter() - retrieve_mitre_start_time
+                self.nodes.extend(mitre_doc_nodes)
+                self.__add_stage_metrics(
+                    stage_name="mitre_document_retrieval",
+                    latency=retrieve_mitre_latency,
+                    retrieved_docs=len(mitre_doc_nodes),
+                )
+            else:
+                reasoning = None
+                self.__add_stage_metrics(
+                    stage_name="mitre_document_retrieval",
+                    latency=0.0,
+                    retrieved_docs=0,
+                )
+
         # Step 3: Generate final explanation
-        explanation_start_time = time.perf_counter()
-        prompt, explanation = self.generate_explanation()
-        explanation_latency = time.perf_counter() - explanation_start_time
-        self.__add_stage_metrics(
-            stage_name="explanation_generation",
-            latency=explanation_latency,
-        )
+        with span("stage.explanation_generation", streamed=on_field is not None):
+            explanation_start_time = time.perf_counter()
+            with count_tokens() as token_counter:
+                async with deadline(STAGE_DEADLINE_SECONDS):
+                    prompt, explanation = await self.agenerate_explanation(
+                        on_field=on_field
+                    )
+            explanation_latency = time.perf_counter() - explanation_start_time
+            self.__add_stage_metrics(
+                stage_name="explanation_generation",
+                latency=explanation_latency,
+                token_counter=token_counter,
+            )
 
         total_latency = time.perf_counter() - total_start_time
         context_nodes = [node.node.text for node in self.nodes]
@@ -248,14 +802,85 @@ class ICSAnomalyExplainer:
             context_nodes=context_nodes,
         )
 
+    def run_experiment(
+        self, on_field: Optional[Callable[[str, str], None]] = None
+    ) -> ExperimentResult:
+        """Blocking wrapper around `arun_experiment`."""
+        return asyncio.run(self.arun_experiment(on_field=on_field))
+
     def save_results(self, output_dir: str, result: ExperimentResult) -> None:
-        """Save all experimental results to JSON file."""
-        results_dict = asdict(result)
+        """Append the experimental results to the results store in `output_dir`."""
+        ResultsStore(output_dir).append(result)
+        self.logger.info(
+            f"Results of attack {self.attack_id} {self.variant.value} saved to "
+            f"{output_dir}"
+        )
+
+
+async def arun_variants(
+    attack_id: int,
+    variants: list[ExperimentVariant],
+    clients: Optional[SharedClients] = None,
+    output_dir: Optional[str] = None,
+) -> list[ExperimentResult]:
+    """
+    Run several variants of one attack together, sharing identical stages.
 
-        output_file = os.path.join(
-            output_dir, f"attack_{self.attack_id}_{self.variant.value}.json"
+    The variants run concurrently, so independent stages such as the unfiltered
+    BASELINE retrieval and the filtered SWaT retrieval overlap, and the filtered
+    retrieval common to NO_MITRE, FULL and FULL_FAST is issued once. Each
+    result reports the latencies its own variant observed, and stages served
+    by another variant's retrieval are marked as `shared`.
+
+    Args:
+        attack_id (int): Attack ID to explain.
+        variants (list[ExperimentVariant]): Variants to run.
+        clients (Optional[SharedClients]): Clients to reuse; created if omitted.
+        output_dir (Optional[str]): If given, each result is saved there.
+
+    Returns:
+        list[ExperimentResult]: Results of the variants that completed
+        successfully, in the order of `variants`.
+    """
+    logger = logging.getLogger(__name__)
+    clients = clients or create_shared_clients()
+    shared_stages: dict[str, asyncio.Task] = {}
+    with span(
+        "run_variants",
+        attack_id=attack_id,
+        variants=[variant.value for variant in variants],
+    ):
+        explainers = [
+            ICSAnomalyExplainer(
+                variant, attack_id, clients=clients, shared_stages=shared_stages
+            )
+            for variant in variants
+        ]
+        results = await asyncio.gather(
+            *(explainer.arun_experiment() for explainer in explainers),
+            return_exceptions=True,
         )
-        with open(output_file, "w") as f:
-            json.dump(results_dict, f, indent=2, default=str)
 
-        self.logger.info(f"Results saved to {output_file}")
+    completed = []
+    for explainer, result in zip(explainers, results):
+        if isinstance(result, BaseException):
+            logger.error(
+                f"Error running experiment for attack {attack_id} "
+                f"with variant {explainer.variant.value}",
+                exc_info=result,
+            )
+            continue
+        if output_dir is not None:
+            explainer.save_results(output_dir, result)
+        completed.append(result)
+    return completed
+
+
+def run_variants(
+    attack_id: int,
+    variants: list[ExperimentVariant],
+    clients: Optional[SharedClients] = None,
+    output_dir: Optional[str] = None,
+) -> list[ExperimentResult]:
+    """Blocking wrapper around `arun_variants`."""
+    return asyncio.run(arun_variants(attack_id, variants, clients, output_dir))
@@ -0,0 +1,410 @@
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Any, Optional
+
+import numpy as np
+from llama_cloud import FilterCondition, FilterOperator, MetadataFilters
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from config import LOCAL_INDEX_DIR
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILE = "index.json"
+NODES_FILE = "nodes.jsonl"
+VECTORS_FILE = "vectors.npy"
+DOC_LENGTHS_FILE = "doc_lengths.npy"
+POSTINGS_INDPTR_FILE = "postings_indptr.npy"
+POSTINGS_DOC_IDS_FILE = "postings_doc_ids.npy"
+POSTINGS_TF_FILE = "postings_tf.npy"
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase word tokens; component IDs such as MV101 stay a single token."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class HashingEmbedding:
+    """
+    Deterministic, offline dense embedding based on feature hashing.
+
+    Word unigrams and character trigrams are hashed into a fixed number of
+    signed buckets and L2-normalised, so no model download or network access
+    is needed and identical text always maps to the identical vector.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def __features(self, text: str) -> list[str]:
+        features = []
+        for token in tokenize(text):
+            features.append(token)
+            padded = f"#{token}#"
+            features.extend(padded[i : i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.__features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 1 else -1.0
+                vectors[row, (digest >> 1) % self.dim] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def matches_filters(
+    metadata: dict[str, Any], filters: Optional[MetadataFilters]
+) -> bool:
+    """Evaluate LlamaCloud metadata filters against a node's metadata."""
+    if filters is None:
+        return True
+
+    results = []
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            results.append(matches_filters(metadata, metadata_filter))
+            continue
+        value = metadata.get(metadata_filter.key)
+        expected = metadata_filter.value
+        operator = metadata_filter.operator or FilterOperator.EQUAL_TO
+        if operator == FilterOperator.EQUAL_TO:
+            result = value == expected
+        elif operator == FilterOperator.NOT_EQUALS:
+            result = value != expected
+        elif operator == FilterOperator.GREATER_THAN:
+            result = value is not None and value > expected
+        elif operator == FilterOperator.LESS_THAN:
+            result = value is not None and value < expected
+        elif operator == FilterOperator.GREATER_THAN_OR_EQUAL_TO:
+            result = value is not None and value >= expected
+        elif operator == FilterOperator.LESS_THAN_OR_EQUAL_TO:
+            result = value is not None and value <= expected
+        elif operator == FilterOperator.IN:
+            result = value in expected
+        elif operator == FilterOperator.NIN:
+            result = value not in expected
+        elif operator == FilterOperator.CONTAINS:
+            result = isinstance(value, list) and expected in value
+        elif operator == FilterOperator.ANY:
+            result = isinstance(value, list) and any(v in value for v in expected)
+        elif operator == FilterOperator.ALL:
+            result = isinstance(value, list) and all(v in value for v in expected)
+        elif operator == FilterOperator.TEXT_MATCH:
+            result = isinstance(value, str) and expected in value
+        elif operator == FilterOperator.TEXT_MATCH_INSENSITIVE:
+            result = isinstance(value, str) and expected.lower() in value.lower()
+        elif operator == FilterOperator.IS_EMPTY:
+            result = value is None or value == [] or value == ""
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        results.append(result)
+
+    condition = filters.condition or FilterCondition.AND
+    if condition == FilterCondition.AND:
+        return all(results)
+    elif condition == FilterCondition.OR:
+        return any(results)
+    elif condition == FilterCondition.NOT:
+        return not any(results)
+    raise ValueError(f"Unsupported filter condition: {condition}")
+
+
+def min_max_normalise(scores: np.ndarray) -> np.ndarray:
+    """Scale scores to [0, 1]; constant non-zero scores all map to 1."""
+    if len(scores) == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores) if high > 0 else np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+class LocalHybridIndex:
+    """
+    In-process hybrid (BM25 + dense) index with the `as_retriever` API of
+    `LlamaCloudIndex`.
+
+    Arrays are stored as `.npy` files and memory-mapped on load, so opening the
+    index is cheap and pages are shared between processes. Node text and
+    metadata are kept in memory for filtering and for building results.
+    """
+
+    def __init__(
+        self,
+        nodes: list[BaseNode],
+        vectors: np.ndarray,
+        doc_lengths: np.ndarray,
+        postings_indptr: np.ndarray,
+        postings_doc_ids: np.ndarray,
+        postings_tf: np.ndarray,
+        vocabulary: dict[str, int],
+        embedding: HashingEmbedding,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.nodes = nodes
+        self.vectors = vectors
+        self.doc_lengths = doc_lengths
+        self.postings_indptr = postings_indptr
+        self.postings_doc_ids = postings_doc_ids
+        self.postings_tf = postings_tf
+        self.vocabulary = vocabulary
+        self.embedding = embedding
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = max(
+            float(doc_lengths.mean()) if len(doc_lengths) else 0.0, 1.0
+        )
+
+    @classmethod
+    def build(
+        cls, nodes: list[BaseNode], embedding: Optional[HashingEmbedding] = None
+    ) -> "LocalHybridIndex":
+        """Build the sparse postings and dense vectors for a list of nodes."""
+        embedding = embedding or HashingEmbedding()
+        texts = [node.get_content() for node in nodes]
+
+        vocabulary: dict[str, int] = {}
+        postings: list[list[tuple[int, int]]] = []
+        doc_lengths = np.zeros(len(nodes), dtype=np.int32)
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                if term not in vocabulary:
+                    vocabulary[term] = len(vocabulary)
+                    postings.append([])
+                postings[vocabulary[term]].append((doc_id, tf))
+
+        postings_indptr = np.zeros(len(postings) + 1, dtype=np.int64)
+        postings_indptr[1:] = np.cumsum([len(entries) for entries in postings])
+        postings_doc_ids = np.array(
+            [doc_id for entries in postings for doc_id, _ in entries], dtype=np.int32
+        )
+        postings_tf = np.array(
+            [tf for entries in postings for _, tf in entries], dtype=np.float32
+        )
+
+        return cls(
+            nodes=nodes,
+            vectors=embedding.embed(texts),
+            doc_lengths=doc_lengths,
+            postings_indptr=postings_indptr,
+            postings_doc_ids=postings_doc_ids,
+            postings_tf=postings_tf,
+            vocabulary=vocabulary,
+            embedding=embedding,
+        )
+
+    def persist(self, persist_dir: str) -> None:
+        """Write the index to a directory of `.npy` arrays and JSON files."""
+        os.makedirs(persist_dir, exist_ok=True)
+        np.save(os.path.join(persist_dir, VECTORS_FILE), self.vectors)
+        np.save(os.path.join(persist_dir, DOC_LENGTHS_FILE), self.doc_lengths)
+        np.save(os.path.join(persist_dir, POSTINGS_INDPTR_FILE), self.postings_indptr)
+        np.save(os.path.join(persist_dir, POSTINGS_DOC_IDS_FILE), self.postings_doc_ids)
+        np.save(os.path.join(persist_dir, POSTINGS_TF_FILE), self.postings_tf)
+        with open(os.path.join(persist_dir, NODES_FILE), "w") as f:
+            for node in self.nodes:
+                f.write(json.dumps(doc_to_json(node)) + "\n")
+        with open(os.path.join(persist_dir, INDEX_FILE), "w") as f:
+            json.dump(
+                {
+                    "embedding_dim": self.embedding.dim,
+                    "k1": self.k1,
+                    "b": self.b,
+                    "vocabulary": self.vocabulary,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "LocalHybridIndex":
+        """Load a persisted index, memory-mapping its arrays."""
+        if not os.path.exists(os.path.join(persist_dir, INDEX_FILE)):
+            raise FileNotFoundError(f"Local index not found: {persist_dir}")
+        with open(os.path.join(persist_dir, INDEX_FILE), "r") as f:
+            settings = json.load(f)
+        with open(os.path.join(persist_dir, NODES_FILE), "r") as f:
+            nodes = [json_to_doc(json.loads(line)) for line in f]
+
+        def load_array(filename: str) -> np.ndarray:
+            return np.load(os.path.join(persist_dir, filename), mmap_mode="r")
+
+        return cls(
+            nodes=nodes,
+            vectors=load_array(VECTORS_FILE),
+            doc_lengths=load_array(DOC_LENGTHS_FILE),
+            postings_indptr=load_array(POSTINGS_INDPTR_FILE),
+            postings_doc_ids=load_array(POSTINGS_DOC_IDS_FILE),
+            postings_tf=load_array(POSTINGS_TF_FILE),
+            vocabulary=settings["vocabulary"],
+            embedding=HashingEmbedding(dim=settings["embedding_dim"]),
+            k1=settings["k1"],
+            b=settings["b"],
+        )
+
+    def dense_scores(self, query: str) -> np.ndarray:
+        """Cosine similarity of the query with every node."""
+        return self.vectors @ self.embedding.embed([query])[0]
+
+    def sparse_scores(self, query: str) -> np.ndarray:
+        """Okapi BM25 score of the query for every node."""
+        scores = np.zeros(len(self.nodes), dtype=np.float32)
+        num_docs = len(self.nodes)
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start = self.postings_indptr[term_id]
+            end = self.postings_indptr[term_id + 1]
+            doc_ids = self.postings_doc_ids[start:end]
+            tf = self.postings_tf[start:end]
+            doc_freq = end - start
+            idf = math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+            length_norm = self.k1 * (
+                1 - self.b + self.b * self.doc_lengths[doc_ids] / self.avg_doc_length
+            )
+            scores[doc_ids] += query_tf * idf * tf * (self.k1 + 1) / (tf + length_norm)
+        return scores
+
+    def as_retriever(self, **kwargs: Any) -> "LocalHybridRetriever":
+        """Return a retriever accepting the same arguments as `LlamaCloudIndex`."""
+        return LocalHybridRetriever(self, **kwargs)
+
+
+class LocalHybridRetriever(BaseRetriever):
+    """
+    Hybrid retriever over a `LocalHybridIndex`.
+
+    Dense and sparse candidates are fused as `alpha * dense + (1 - alpha) *
+    sparse` on min-max normalised scores, as in LlamaCloud hybrid search. There
+    is no local reranking model, so `enable_reranking` only truncates the fused
+    ranking to `rerank_top_n`.
+    """
+
+    def __init__(
+        self,
+        index: LocalHybridIndex,
+        dense_similarity_top_k: int = 3,
+        sparse_similarity_top_k: int = 3,
+        alpha: float = 0.5,
+        enable_reranking: bool = False,
+        rerank_top_n: Optional[int] = None,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ):
+        super().__init__()
+        self.index = index
+        self.dense_similarity_top_k = dense_similarity_top_k
+        self.sparse_similarity_top_k = sparse_similarity_top_k
+        self.alpha = alpha
+        self.top_n = (
+            rerank_top_n
+            if enable_reranking and rerank_top_n
+            else max(dense_similarity_top_k, sparse_similarity_top_k)
+        )
+        self.filters = filters
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        query = query_bundle.query_str
+        candidates = np.array(
+            [
+                doc_id
+                for doc_id, node in enumerate(self.index.nodes)
+                if matches_filters(node.metadata, self.filters)
+            ],
+            dtype=np.int64,
+        )
+        if len(candidates) == 0:
+            return []
+
+        dense = self.index.dense_scores(query)[candidates]
+        sparse = self.index.sparse_scores(query)[candidates]
+        dense_top = np.argsort(-dense, kind="stable")[: self.dense_similarity_top_k]
+        sparse_top = np.argsort(-sparse, kind="stable")[: self.sparse_similarity_top_k]
+        sparse_top = sparse_top[sparse[sparse_top] > 0]
+        pool = np.union1d(dense_top, sparse_top)
+
+        fused = self.alpha * min_max_normalise(dense[pool]) + (
+            1 - self.alpha
+        ) * min_max_normalise(sparse[pool])
+        ranking = np.argsort(-fused, kind="stable")[: self.top_n]
+        return [
+            NodeWithScore(
+                node=self.index.nodes[candidates[pool[i]]], score=float(fused[i])
+            )
+            for i in ranking
+        ]
+
+
+def load_chunks(path: str) -> list[BaseNode]:
+    """Load chunks from JSONL; each line is `{"text", "metadata"}` or a stored node."""
+    nodes = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            chunk = json.loads(line)
+            if "__type__" in chunk:
+                nodes.append(json_to_doc(chunk))
+            else:
+                nodes.append(
+                    TextNode(text=chunk["text"], metadata=chunk.get("metadata", {}))
+                )
+    return nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the local hybrid index from a JSONL file of chunks"
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=True,
+        help='JSONL file with one {"text": ..., "metadata": {...}} chunk per line',
+    )
+    parser.add_argument(
+        "--persist-dir",
+        type=str,
+        default=LOCAL_INDEX_DIR,
+        help="Directory to write the index to",
+    )
+    parser.add_argument(
+        "--embedding-dim",
+        type=int,
+        default=512,
+        help="Dimension of the hashed dense vectors",
+    )
+    args = parser.parse_args()
+
+    nodes = load_chunks(args.input)
+    index = LocalHybridIndex.build(nodes, HashingEmbedding(dim=args.embedding_dim))
+    index.persist(args.persist_dir)
+    logger.info(
+        f"Indexed {len(nodes)} chunks with {len(index.vocabulary)} terms "
+        f"to {args.persist_dir}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
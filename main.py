@@ -1,17 +1,52 @@
 import argparse
+import importlib
 import logging
 import os
+import time
 
 from dotenv import load_dotenv
 
+from config import TRACE_FILE, TRACING_ENABLED
 from constants import VARIANT_MAP
-from ics_anomaly_explainer import ICSAnomalyExplainer
+from tracing import configure_tracing, span
 
 load_dotenv()
 
+PROCESS_START = time.perf_counter()
 
 logger = logging.getLogger(__name__)
 
+# Slow to import, so they are imported in `main` after the arguments are
+# parsed, in this order, which lets `--import-profile` time each of them.
+HEAVY_MODULES = [
+    "llama_index.core",
+    "llama_cloud",
+    "ics_anomaly_explainer",
+]
+
+
+def import_modules(modules: list[str]) -> list[tuple[str, float]]:
+    """Import modules in order, timing each on top of those imported before it."""
+    timings = []
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings.append((f"import {module}", time.perf_counter() - start))
+    return timings
+
+
+def log_startup_profile(timings: list[tuple[str, float]]) -> None:
+    """Log the startup breakdown and the time until the first stage starts."""
+    lines = [f"  {name:<40} {seconds:7.3f} s" for name, seconds in timings]
+    first_stage = time.perf_counter() - PROCESS_START
+    lines.append(f"  {'time to first stage':<40} {first_stage:7.3f} s")
+    logger.info("Startup profile:\n" + "\n".join(lines))
+
+
+def log_field(name: str, value: str) -> None:
+    """Log an explanation field as soon as it has been streamed."""
+    logger.info(f"{name}: {value}")
+
 
 def main():
     # Parse command line arguments
@@ -25,9 +60,24 @@ def main():
         "--variant",
         type=str,
         required=True,
-        choices=["BASELINE", "NO_MITRE", "FULL"],
+        choices=["BASELINE", "NO_MITRE", "FULL", "FULL_FAST"],
         help="Experiment variants to run",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the explanation, logging each field as soon as it is complete",
+    )
+    parser.add_argument(
+        "--import-profile",
+        action="store_true",
+        help="Log how long imports and client setup take before the first stage",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help=f"Export nested timing spans to {TRACE_FILE}",
+    )
     parser.add_argument(
         "--output-dir",
         type=str,
@@ -41,13 +91,37 @@ def main():
         os.makedirs(args.output_dir)
         logger.debug(f"Created output directory: {args.output_dir}")
 
+    if args.trace or TRACING_ENABLED:
+        configure_tracing(TRACE_FILE)
+
     # Run the experiment based on the variant
     logger.info(f"\nExperiment for attack {args.attack} with variant {args.variant}")
     try:
-        variant = VARIANT_MAP[args.variant]
-        explainer = ICSAnomalyExplainer(variant, args.attack)
-        result = explainer.run_experiment()
-        explainer.save_results(args.output_dir, result)
+        with span("main", attack_id=args.attack, variant=args.variant):
+            with span("imports"):
+                timings = import_modules(HEAVY_MODULES)
+            from clients import create_shared_clients, warm_up
+            from ics_anomaly_explainer import ICSAnomalyExplainer
+
+            start = time.perf_counter()
+            clients = create_shared_clients()
+            timings.append(("create clients", time.perf_counter() - start))
+            # The LLM and tokenizer are first needed after the SWaT retrieval.
+            warm_up(clients)
+
+            variant = VARIANT_MAP[args.variant]
+            start = time.perf_counter()
+            with span("explainer.init"):
+                explainer = ICSAnomalyExplainer(variant, args.attack, clients=clients)
+            timings.append(("explainer init", time.perf_counter() - start))
+            if args.import_profile:
+                log_startup_profile(timings)
+
+            result = explainer.run_experiment(
+                on_field=log_field if args.stream else None
+            )
+            with span("save_results"):
+                explainer.save_results(args.output_dir, result)
         logger.info(
             f"Experiment for attack {args.attack} with variant {args.variant} completed successfully"
         )
@@ -0,0 +1,317 @@
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, AsyncGenerator, Iterator, Optional
+
+from llama_cloud import FilterOperator, MetadataFilters
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.program.utils import create_flexible_model
+from llama_index.core.prompts import PromptTemplate
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from pydantic import BaseModel, Field, PrivateAttr
+
+from cache import canonical_filters
+from config import (
+    MOCK_CHARS_PER_TOKEN,
+    MOCK_LLM_SECONDS_PER_TOKEN,
+    MOCK_LLM_TIME_TO_FIRST_TOKEN,
+    MOCK_RETRIEVAL_LATENCY,
+    MOCK_SEED,
+)
+from models import ExplanationOutput, TacticsOutput
+from token_counting import approximate_encode, record_usage
+
+MOCK_MODEL_NAME = "mock-llm"
+
+# Canned structured outputs, by output schema name.
+MOCK_OUTPUTS: dict[str, dict[str, Any]] = {
+    TacticsOutput.__name__: TacticsOutput(
+        tactics=["Impair Process Control", "Inhibit Response Function", "Impact"],
+        reasoning=(
+            "The component's readings deviate sharply from their baseline while "
+            "the process keeps running, which is consistent with manipulated "
+            "control values and suppressed safety responses."
+        ),
+    ).model_dump(),
+    ExplanationOutput.__name__: ExplanationOutput(
+        explanation=(
+            "The component's readings moved far outside their baseline range "
+            "during the detection window. The change is abrupt rather than "
+            "gradual, which points to a direct manipulation of the value."
+        ),
+        possible_cause=(
+            "An attacker likely overwrote the sensor value or setpoint through "
+            "the PLC. A sensor fault is less likely given the sudden onset."
+        ),
+        potential_impact=(
+            "Downstream control logic acts on the false reading, which can "
+            "drive actuators into unsafe states. Product quality and equipment "
+            "safety in the affected stage are at risk."
+        ),
+        mitigation_strategy=(
+            "Cross-check the reading against redundant sensors and the process "
+            "physics. Restrict write access to the PLC and alert on setpoint "
+            "changes outside maintenance windows."
+        ),
+    ).model_dump(),
+}
+
+
+def sample_latency(spec: dict[str, Any], rng: random.Random) -> float:
+    """
+    Draw a latency in seconds from a distribution spec such as
+    `{"distribution": "lognormal", "median": 0.4, "sigma": 0.5}`.
+    """
+    distribution = spec["distribution"]
+    if distribution == "constant":
+        return spec["value"]
+    elif distribution == "uniform":
+        return rng.uniform(spec["low"], spec["high"])
+    elif distribution == "normal":
+        return max(0.0, rng.gauss(spec["mean"], spec["std"]))
+    elif distribution == "lognormal":
+        return rng.lognormvariate(0.0, spec["sigma"]) * spec["median"]
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+
+class MockLLM(CustomLLM):
+    """
+    Offline stand-in for the OpenAI LLM with canned structured outputs.
+
+    Each completion waits for a sampled time to first token plus a fixed time
+    per output token, then returns the canned output of the schema named in
+    the structured prompt. Token usage is estimated from text length and
+    reported in `raw["usage"]`, as OpenAI does, so it is counted by the
+    request's token counter without a tokenizer.
+    """
+
+    time_to_first_token: dict[str, Any] = Field(
+        default_factory=lambda: dict(MOCK_LLM_TIME_TO_FIRST_TOKEN)
+    )
+    seconds_per_token: float = MOCK_LLM_SECONDS_PER_TOKEN
+    outputs: dict[str, dict[str, Any]] = Field(
+        default_factory=lambda: dict(MOCK_OUTPUTS)
+    )
+    seed: int = MOCK_SEED
+
+    _rng: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "mock_llm"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=MOCK_MODEL_NAME, is_chat_model=False)
+
+    def __output_for(self, prompt: str) -> dict[str, Any]:
+        """Find the canned output of the schema embedded in a structured prompt."""
+        for name, output in self.outputs.items():
+            if f'"title": "{name}"' in prompt:
+                return output
+        raise ValueError("MockLLM has no canned output for this prompt")
+
+    def __sample_duration(self, completion: str) -> float:
+        completion_tokens = len(approximate_encode(completion))
+        return (
+            sample_latency(self.time_to_first_token, self._rng)
+            + completion_tokens * self.seconds_per_token
+        )
+
+    def __response(self, prompt: str, completion: str) -> CompletionResponse:
+        prompt_tokens = len(approximate_encode(prompt))
+        completion_tokens = len(approximate_encode(completion))
+        return CompletionResponse(
+            text=completion,
+            raw={
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+            },
+        )
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        completion = json.dumps(self.__output_for(prompt))
+        time.sleep(self.__sample_duration(completion))
+        return self.__response(prompt, completion)
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        completion = json.dumps(self.__output_for(prompt))
+        await asyncio.sleep(self.__sample_duration(completion))
+        return self.__response(prompt, completion)
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        completion = json.dumps(self.__output_for(prompt))
+
+        def gen() -> Iterator[CompletionResponse]:
+            time.sleep(sample_latency(self.time_to_first_token, self._rng))
+            text = ""
+            for delta in split_tokens(completion):
+                time.sleep(self.seconds_per_token)
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return gen()
+
+    async def _structured_astream_call(
+        self,
+        output_cls: type[BaseModel],
+        prompt: PromptTemplate,
+        llm_kwargs: Optional[dict[str, Any]] = None,
+        **prompt_args: Any,
+    ) -> AsyncGenerator[BaseModel, None]:
+        """Stream the canned output field by field, one token at a time."""
+        output = self.outputs[output_cls.__name__]
+        completion = json.dumps(output)
+        formatted_prompt = prompt.format(**prompt_args)
+        flexible_cls = create_flexible_model(output_cls)
+
+        async def gen() -> AsyncGenerator[BaseModel, None]:
+            await asyncio.sleep(sample_latency(self.time_to_first_token, self._rng))
+            partial: dict[str, Any] = {}
+            for name, value in output.items():
+                if isinstance(value, list):
+                    partial[name] = []
+                    for item in value:
+                        await asyncio.sleep(
+                            len(approximate_encode(item)) * self.seconds_per_token
+                        )
+                        partial[name] = partial[name] + [item]
+                        yield flexible_cls(**partial)
+                else:
+                    partial[name] = ""
+                    for delta in split_tokens(value):
+                        await asyncio.sleep(self.seconds_per_token)
+                        partial[name] += delta
+                        yield flexible_cls(**partial)
+            # Streamed responses carry no usage, so it is recorded directly.
+            record_usage(
+                formatted_prompt,
+                completion,
+                len(approximate_encode(formatted_prompt)),
+                len(approximate_encode(completion)),
+            )
+            yield output_cls.model_validate(output)
+
+        return gen()
+
+
+def split_tokens(text: str) -> Iterator[str]:
+    """Split text into the mock tokens counted by `approximate_encode`."""
+    for start in range(0, len(text), MOCK_CHARS_PER_TOKEN):
+        yield text[start : start + MOCK_CHARS_PER_TOKEN]
+
+
+def filter_metadata(filters: Optional[MetadataFilters], rank: int) -> dict[str, Any]:
+    """Build node metadata that satisfies equality and membership filters."""
+    metadata: dict[str, Any] = {}
+    if filters is None:
+        return metadata
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            metadata.update(filter_metadata(metadata_filter, rank))
+        elif metadata_filter.operator in (None, FilterOperator.EQUAL_TO):
+            metadata[metadata_filter.key] = metadata_filter.value
+        elif metadata_filter.operator == FilterOperator.IN and metadata_filter.value:
+            values = metadata_filter.value
+            metadata[metadata_filter.key] = values[rank % len(values)]
+    return metadata
+
+
+class MockRetriever(BaseRetriever):
+    """
+    Retriever that returns synthetic chunks after a sampled latency.
+
+    The chunks echo the query and carry metadata matching the equality and
+    membership filters, so the pipeline's filter-dependent steps behave as
+    with the real index. Node ids are derived from the query and filters, so
+    repeated retrievals return the same nodes.
+    """
+
+    def __init__(
+        self,
+        index: "MockIndex",
+        dense_similarity_top_k: int = 3,
+        sparse_similarity_top_k: int = 3,
+        enable_reranking: bool = False,
+        rerank_top_n: Optional[int] = None,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ):
+        super().__init__()
+        self.index = index
+        self.top_n = (
+            rerank_top_n
+            if enable_reranking and rerank_top_n
+            else max(dense_similarity_top_k, sparse_similarity_top_k)
+        )
+        self.filters = filters
+
+    def __nodes(self, query: str) -> list[NodeWithScore]:
+        filters_json = json.dumps(canonical_filters(self.filters))
+        nodes = []
+        for rank in range(self.top_n):
+            metadata = {"doc_type": "component", **filter_metadata(self.filters, rank)}
+            node_id = hashlib.sha256(
+                f"{query}\0{filters_json}\0{rank}".encode("utf-8")
+            ).hexdigest()
+            text = f"Mock document {rank + 1} for '{query}'. " + ", ".join(
+                f"{key}: {value}" for key, value in metadata.items()
+            )
+            nodes.append(
+                NodeWithScore(
+                    node=TextNode(id_=node_id, text=text, metadata=metadata),
+                    score=1.0 / (rank + 1),
+                )
+            )
+        return nodes
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        time.sleep(self.index.sample_latency())
+        return self.__nodes(query_bundle.query_str)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        await asyncio.sleep(self.index.sample_latency())
+        return self.__nodes(query_bundle.query_str)
+
+
+class MockIndex:
+    """Offline stand-in for `LlamaCloudIndex`, serving `MockRetriever`s."""
+
+    def __init__(
+        self,
+        latency: Optional[dict[str, Any]] = None,
+        seed: int = MOCK_SEED,
+    ):
+        self.latency = latency or dict(MOCK_RETRIEVAL_LATENCY)
+        self.rng = random.Random(seed)
+
+    def sample_latency(self) -> float:
+        return sample_latency(self.latency, self.rng)
+
+    def as_retriever(self, **kwargs: Any) -> MockRetriever:
+        return MockRetriever(self, **kwargs)
@@ -9,6 +9,7 @@ class ExperimentVariant(Enum):
     BASELINE = "BASELINE"  # Naive RAG: No metadata filtering
     NO_MITRE = "NO_MITRE"  # Complex RAG: Only SWaT metadata filtering
     FULL = "FULL"  # Advanced RAG: SWaT metadata filtering + MITRE ATT&CK metadata inference
+    FULL_FAST = "FULL_FAST"  # FULL with MITRE tactics ranked by a local tactic index
 
 
 @dataclass
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -11,3 +12,19 @@ class StageMetrics:
     input_tokens: int
     output_tokens: int
     retrieved_docs: int = 0
+    cache_hits: int = 0  # Retrievals and completions served from the local cache
+    shared: bool = False  # Served by the same stage of another variant (run_variants)
+    context_tokens_saved: int = 0  # Removed from the prompt by context packing
+    hedged_requests: int = 0  # Backup requests sent for slow requests
+    retries: int = 0  # Requests retried after a transient failure
+    rate_limit_wait: float = 0.0  # Seconds LLM requests waited for rate limit budget
+    # FULL only: whether the speculative MITRE retrieval matched the inferred
+    # tactics (None if none was started), the seconds that saved, and the
+    # query its techniques were retrieved with if they were used.
+    speculative_hit: Optional[bool] = None
+    speculation_saved: float = 0.0
+    speculative_query: Optional[str] = None
+    # Streaming only: seconds from stage start to the first partial output, and
+    # to the completion of each output field.
+    time_to_first_token: Optional[float] = None
+    field_latencies: Optional[dict[str, float]] = None
@@ -4,11 +4,11 @@ import os
 import pickle
 import warnings
 from io import BytesIO
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 import requests
-from tqdm import tqdm
 
 warnings.simplefilter(action="ignore", category=UserWarning)
 
@@ -22,6 +22,10 @@ FILENAME = "all-detection-points.pkl"
 DETECTION_POINTS_FILE = f"meta-storage/{MODEL_NAME}-{FILENAME}"
 DETECTIONS_DIR = "data/detections/"
 SWAT_DATA_FILE = f"data/SWATV0_{{TYPE}}.csv"
+# One .npy file per column of SWAT_DATA_FILE, converted on first load
+SWAT_CACHE_DIR = "data/swat-cache/{TYPE}/"
+SWAT_CACHE_META_FILE = "columns.json"
+STAT_NAMES = ["mean", "std", "min", "max", "count"]
 ATTRIBUTIONS_FILE = "attributions.json"
 OUTPUT_DIR = "output/"
 
@@ -55,23 +59,130 @@ def fetch_detection_points() -> dict:
         )
 
 
-def retrieve_swat_data(data_type: str) -> pd.DataFrame:
+def compact_column(values: pd.Series) -> np.ndarray:
+    """
+    Convert a column to the smallest dtype that holds it: int8 for actuator
+    states, float32 for sensor readings.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype="datetime64[ns]")
+    if pd.api.types.is_integer_dtype(values):
+        info = np.iinfo(np.int8)
+        if values.min() >= info.min and values.max() <= info.max:
+            return values.to_numpy(dtype=np.int8)
+        return values.to_numpy()
+    if pd.api.types.is_float_dtype(values):
+        return values.to_numpy(dtype=np.float32)
+    return values.to_numpy(dtype=str)
+
+
+def build_swat_cache(data_type: str) -> dict:
+    """
+    Convert the SWAT data CSV to one .npy file per column.
+
+    Args:
+        data_type (str): The type of SWAT data to convert.
+
+    Returns:
+        dict: The cache metadata, with the source file's size and modification
+        time and the file of each column.
+    """
+    local_path = SWAT_DATA_FILE.format(TYPE=data_type)
+    cache_dir = SWAT_CACHE_DIR.format(TYPE=data_type)
+    logger.info(f"Converting {local_path} to columnar cache in {cache_dir}")
+    dataframe = pd.read_csv(local_path)
+    dataframe["Timestamp"] = pd.to_datetime(dataframe["Timestamp"], errors="coerce")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    columns = {}
+    for position, column in enumerate(dataframe.columns):
+        # Column names are not valid file names in general, e.g. "Normal/Attack".
+        filename = f"{position:03d}.npy"
+        np.save(os.path.join(cache_dir, filename), compact_column(dataframe[column]))
+        columns[column] = filename
+
+    source = os.stat(local_path)
+    meta = {
+        "source_size": source.st_size,
+        "source_mtime": source.st_mtime,
+        "rows": len(dataframe),
+        "columns": columns,
+    }
+    # The metadata is written last, so an interrupted conversion is redone.
+    meta_path = os.path.join(cache_dir, SWAT_CACHE_META_FILE)
+    with open(f"{meta_path}.tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(f"{meta_path}.tmp", meta_path)
+    return meta
+
+
+def load_swat_cache_meta(data_type: str) -> Optional[dict]:
+    """
+    Load the metadata of the columnar cache, or None if it is missing or older
+    than the SWAT data CSV it was converted from.
+    """
+    local_path = SWAT_DATA_FILE.format(TYPE=data_type)
+    meta_path = os.path.join(
+        SWAT_CACHE_DIR.format(TYPE=data_type), SWAT_CACHE_META_FILE
+    )
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r") as f:
+        meta = json.load(f)
+    if os.path.exists(local_path):
+        source = os.stat(local_path)
+        if (meta["source_size"], meta["source_mtime"]) != (
+            source.st_size,
+            source.st_mtime,
+        ):
+            return None
+    return meta
+
+
+def swat_cache_meta(data_type: str) -> dict:
+    """Load the metadata of the columnar cache, converting the CSV if needed."""
+    meta = load_swat_cache_meta(data_type)
+    if meta is None:
+        local_path = SWAT_DATA_FILE.format(TYPE=data_type)
+        if not os.path.exists(local_path):
+            raise FileNotFoundError(f"SWAT data file not found: {local_path}")
+        meta = build_swat_cache(data_type)
+    return meta
+
+
+def retrieve_swat_data(
+    data_type: str, columns: Optional[list[str]] = None
+) -> pd.DataFrame:
     """
     Retrieve SWAT data from the local storage.
 
+    The CSV is converted to a columnar cache on first use, or when it has
+    changed. Only the requested columns are then read, memory-mapped from the
+    cache.
+
     Args:
         data_type (str): The type of SWAT data to retrieve.
+        columns (list[str], optional): The columns to retrieve. Defaults to all.
 
     Returns:
         pd.DataFrame: A DataFrame containing the SWAT data.
     """
-    local_path = SWAT_DATA_FILE.format(TYPE=data_type)
-    if os.path.exists(local_path):
-        dataframe = pd.read_csv(local_path)
-        dataframe["Timestamp"] = pd.to_datetime(dataframe["Timestamp"], errors="coerce")
-        return dataframe
-    else:
-        raise FileNotFoundError(f"SWAT data file not found: {local_path}")
+    meta = swat_cache_meta(data_type)
+    cache_dir = SWAT_CACHE_DIR.format(TYPE=data_type)
+    if columns is None:
+        columns = list(meta["columns"])
+    missing = [column for column in columns if column not in meta["columns"]]
+    if missing:
+        raise KeyError(f"Columns not in SWAT {data_type} data: {missing}")
+    return pd.DataFrame(
+        {
+            column: np.load(
+                os.path.join(cache_dir, meta["columns"][column]), mmap_mode="r"
+            )
+            for column in columns
+        },
+        copy=False,
+    )
 
 
 def calculate_stats(values: np.ndarray) -> dict:
@@ -80,34 +191,128 @@ def calculate_stats(values: np.ndarray) -> dict:
         return {"mean": 0, "std": 0, "min": 0, "max": 0, "count": 0}
 
     return {
-        "mean": float(np.mean(values)),
-        "std": float(np.std(values)),
+        # Accumulate in float64, as sensor readings are stored as float32
+        "mean": float(np.mean(values, dtype=np.float64)),
+        "std": float(np.std(values, dtype=np.float64)),
         "min": float(np.min(values)),
         "max": float(np.max(values)),
         "count": len(values),
     }
 
 
-def compute_anomaly_statistics(
-    detection_points: np.ndarray,
-    test_dataset: pd.DataFrame,
-    component_name: str,
-) -> dict:
+def baseline_window(detection_points: np.ndarray, rows: int) -> tuple[int, int]:
+    """
+    Rows [start, end) of the baseline: the recent historical data before the
+    detection window, as long as the window.
+    """
     detection_min = min(detection_points)
     detection_max = max(detection_points)
-
-    # Baseline: Use recent historical data before the detection window
     baseline_end = detection_min - 1
     baseline_start = max(0, baseline_end - (detection_max - detection_min))
-    baseline_values = test_dataset.iloc[baseline_start:baseline_end][
-        component_name
-    ].values
+    # Same rows as `iloc[baseline_start:baseline_end]`
+    start, end, _ = slice(baseline_start, baseline_end).indices(rows)
+    return start, max(start, end)
+
+
+def segment_stats(values: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """
+    Statistics of consecutive segments of an array.
+
+    Args:
+        values (np.ndarray): The segments' values concatenated.
+        counts (np.ndarray): Values in each segment.
+
+    Returns:
+        np.ndarray: (segments, len(STAT_NAMES)) statistics, zero for empty
+        segments as in `calculate_stats`.
+    """
+    stats = np.zeros((len(counts), len(STAT_NAMES)))
+    nonempty = counts > 0
+    if not nonempty.any():
+        return stats
+    offsets = (np.cumsum(counts) - counts)[nonempty]
+    n = counts[nonempty]
+    values = values.astype(np.float64)
+    means = np.add.reduceat(values, offsets) / n
+    squared_deviations = (values - np.repeat(means, n)) ** 2
+    stats[nonempty] = np.column_stack(
+        [
+            means,
+            np.sqrt(np.add.reduceat(squared_deviations, offsets) / n),
+            np.minimum.reduceat(values, offsets),
+            np.maximum.reduceat(values, offsets),
+            n,
+        ]
+    )
+    return stats
+
 
-    detected_values = test_dataset.iloc[detection_points][component_name].values
+def compute_window_statistics(
+    detection_points: list[np.ndarray],
+    test_dataset: pd.DataFrame,
+    features: list[str],
+    requested: Optional[np.ndarray] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the baseline and detected statistics of many detection windows
+    and features at once.
 
-    # Calculate stats
-    baseline_stats = calculate_stats(baseline_values)
-    detected_stats = calculate_stats(detected_values)
+    For each feature, the rows of every window it is requested for are
+    gathered with one fancy index, and each window is reduced as a segment of
+    the gathered values.
+
+    Args:
+        detection_points (list[np.ndarray]): Detection points of each window.
+        test_dataset (pd.DataFrame): The SWAT data.
+        features (list[str]): Columns to compute the statistics of.
+        requested (np.ndarray, optional): (windows, features) mask of the
+            statistics to compute. Defaults to all.
+
+    Returns:
+        tuple: Baseline and detected statistics, each a
+        (windows, features, len(STAT_NAMES)) array, NaN where not requested.
+    """
+    rows = len(test_dataset)
+    points = [np.asarray(window, dtype=np.int64) for window in detection_points]
+    baseline_ranges = [baseline_window(window, rows) for window in points]
+    baselines = [np.arange(start, end) for start, end in baseline_ranges]
+    baseline_counts = np.array([len(window) for window in baselines], np.int64)
+    detected_counts = np.array([len(window) for window in points], np.int64)
+    if requested is None:
+        requested = np.ones((len(points), len(features)), dtype=bool)
+
+    shape = (len(points), len(features), len(STAT_NAMES))
+    baseline_stats = np.full(shape, np.nan)
+    detected_stats = np.full(shape, np.nan)
+    empty = np.empty(0, np.int64)
+    for i, feature in enumerate(features):
+        windows = np.flatnonzero(requested[:, i])
+        if len(windows) == 0:
+            continue
+        column = test_dataset[feature].to_numpy()
+        baseline_index = np.concatenate([baselines[w] for w in windows] + [empty])
+        detected_index = np.concatenate([points[w] for w in windows] + [empty])
+        baseline_stats[windows, i] = segment_stats(
+            column[baseline_index], baseline_counts[windows]
+        )
+        detected_stats[windows, i] = segment_stats(
+            column[detected_index], detected_counts[windows]
+        )
+    return baseline_stats, detected_stats
+
+
+def format_statistics(baseline: np.ndarray, detected: np.ndarray) -> dict:
+    """
+    Format the statistics of one window and feature.
+
+    Raises:
+        ZeroDivisionError: If the baseline mean is zero, as the change
+            percentage is undefined.
+    """
+    baseline_stats = dict(zip(STAT_NAMES, map(float, baseline)))
+    detected_stats = dict(zip(STAT_NAMES, map(float, detected)))
+    baseline_stats["count"] = int(baseline_stats["count"])
+    detected_stats["count"] = int(detected_stats["count"])
     detected_change_pct = (
         (detected_stats["mean"] - baseline_stats["mean"]) / baseline_stats["mean"] * 100
     )
@@ -119,33 +324,131 @@ def compute_anomaly_statistics(
     }
 
 
+def compute_feature_statistics(
+    detection_points: np.ndarray,
+    test_dataset: pd.DataFrame,
+    features: list[str],
+) -> dict[str, dict]:
+    """Compute the anomaly statistics of one detection window for each feature."""
+    baseline, detected = compute_window_statistics(
+        [detection_points], test_dataset, features
+    )
+    return {
+        feature: format_statistics(baseline[0, i], detected[0, i])
+        for i, feature in enumerate(features)
+    }
+
+
+def compute_anomaly_statistics(
+    detection_points: np.ndarray,
+    test_dataset: pd.DataFrame,
+    component_name: str,
+) -> dict:
+    return compute_feature_statistics(detection_points, test_dataset, [component_name])[
+        component_name
+    ]
+
+
+def compute_attack_statistics(
+    detection_points: dict, test_dataset: pd.DataFrame, attributions: list[dict]
+) -> list[dict]:
+    """
+    Compute the anomaly statistics of every attributed feature of every attack
+    in one batch.
+
+    Each entry has the statistics of the top attribution at the top level, as
+    read by the explainer, and of every attributed feature under
+    `feature_statistics`. An attack fails, with an entry of only its attack
+    number, if it has no attributions or detection points, if any of its
+    features is not in the data or any of its detection points is outside it,
+    or if the baseline mean of its top attribution is zero. Other features
+    with a zero baseline mean are left out of `feature_statistics`. Attacks
+    are checked before the batch, so that one failing attack does not fail
+    the others.
+    """
+    data_rows = len(test_dataset)
+    windows, attack_features = {}, {}
+    for attribution in attributions:
+        attack_number = attribution["attack_number"]
+        try:
+            features = [attr["feature"] for attr in attribution["attributions"]]
+            points = np.asarray(detection_points[attack_number], dtype=np.int64)
+            if not features or len(points) == 0:
+                raise ValueError("No attributions or detection points")
+            missing = [name for name in features if name not in test_dataset]
+            if missing:
+                raise KeyError(f"Features not in SWAT data: {missing}")
+            if points.min() < 0 or points.max() >= data_rows:
+                raise IndexError(f"Detection points outside the {data_rows} SWAT rows")
+        except Exception:
+            logger.exception(f"Error processing attribution {attack_number}")
+            continue
+        windows[attack_number] = points
+        attack_features[attack_number] = features
+
+    features = sorted(set().union(*attack_features.values()))
+    column = {feature: i for i, feature in enumerate(features)}
+    rows = {attack_number: i for i, attack_number in enumerate(windows)}
+    requested = np.zeros((len(rows), len(features)), dtype=bool)
+    for attack_number, names in attack_features.items():
+        requested[rows[attack_number], [column[name] for name in names]] = True
+    baseline, detected = compute_window_statistics(
+        list(windows.values()), test_dataset, features, requested
+    )
+
+    anomaly_statistics = []
+    for attribution in attributions:
+        attack_number = attribution["attack_number"]
+        result = {}
+        if attack_number in rows:
+            row = rows[attack_number]
+            feature_statistics = {}
+            for attr in attribution["attributions"]:
+                feature = attr["feature"]
+                try:
+                    feature_statistics[feature] = format_statistics(
+                        baseline[row, column[feature]], detected[row, column[feature]]
+                    )
+                except ZeroDivisionError:
+                    logger.warning(
+                        f"Zero baseline mean of {feature} in attack {attack_number}"
+                    )
+            top_feature = attribution["attributions"][0]["feature"]
+            if top_feature in feature_statistics:
+                result = {
+                    **feature_statistics[top_feature],
+                    "top_attribution": top_feature,
+                    "feature_statistics": feature_statistics,
+                }
+            else:
+                logger.error(f"Error processing attribution {attack_number}")
+        result["attack_number"] = attack_number
+        anomaly_statistics.append(result)
+    return anomaly_statistics
+
+
 def main():
     """
     Main execution function to compute anomaly statistics based on detection points.
     """
     detection_points = fetch_detection_points()
-    df_test = retrieve_swat_data("test")
     attributions = json.load(open(os.path.join(OUTPUT_DIR, ATTRIBUTIONS_FILE), "r"))
+    features = {
+        attr["feature"]
+        for attribution in attributions
+        for attr in attribution["attributions"]
+    }
+    # Attacks with features that are not in the data are failed by
+    # `compute_attack_statistics`, so only the available ones are loaded.
+    available = swat_cache_meta("test")["columns"]
+    missing = features - set(available)
+    if missing:
+        logger.warning(f"Attributed features not in SWAT data: {sorted(missing)}")
+    df_test = retrieve_swat_data("test", columns=sorted(features & set(available)))
 
-    anomaly_statistics = []
-    for attribution in tqdm(
-        attributions, desc="Processing Attributions", unit="attribution"
-    ):
-        try:
-            top_feature = attribution["attributions"][0]["feature"]
-            result = compute_anomaly_statistics(
-                detection_points=detection_points[attribution["attack_number"]],
-                test_dataset=df_test,
-                component_name=top_feature,
-            )
-            result["top_attribution"] = top_feature
-        except Exception as e:
-            logger.exception(
-                f"Error processing attribution {attribution['attack_number']}"
-            )
-            result = {}
-        result["attack_number"] = attribution["attack_number"]
-        anomaly_statistics.append(result)
+    anomaly_statistics = compute_attack_statistics(
+        detection_points, df_test, attributions
+    )
 
     with open(os.path.join(OUTPUT_DIR, "anomaly_statistics.json"), "w") as f:
         json.dump(anomaly_statistics, f, indent=4)
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from config import (
+    RATE_LIMIT_COMPLETION_TOKENS,
+    RATE_LIMIT_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_TOKENS_PER_MINUTE,
+)
+
+# Weight of the latest request in the running estimates of each request kind.
+ESTIMATE_SMOOTHING = 0.2
+
+
+class TokenBucket:
+    """
+    A budget that refills continuously up to its capacity.
+
+    Consuming more than is available leaves the bucket in debt, which is paid
+    off by the refill before anything else can be consumed.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.capacity,
+            self.level + (now - self.updated_at) * self.refill_per_second,
+        )
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` can be consumed."""
+        self.__refill()
+        return max(0.0, (amount - self.level) / self.refill_per_second)
+
+    def consume(self, amount: float) -> None:
+        self.__refill()
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        self.__refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimitScheduler:
+    """
+    Schedules LLM requests within the provider's request and token rate limits.
+
+    Requests wait for both a request and a token bucket, so that bursts of
+    concurrent explainers are spread out instead of being rejected with 429s.
+    Waiting requests are granted round-robin across keys (attacks), so one
+    attack's requests cannot starve another's, and in order within a key.
+
+    The tokens of a request are estimated up front from its prompt plus the
+    recent completion size and prompt overhead of the same kind of request.
+    Once the request has been counted, `settle` charges or refunds the
+    difference and updates those estimates.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = RATE_LIMIT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = RATE_LIMIT_TOKENS_PER_MINUTE,
+        completion_tokens: int = RATE_LIMIT_COMPLETION_TOKENS,
+    ):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.default_completion_tokens = completion_tokens
+        self.completion_tokens: dict[str, float] = {}
+        self.prompt_overhead: dict[str, float] = {}
+        self.queues: OrderedDict[str, deque[tuple[int, asyncio.Future]]] = OrderedDict()
+        self.dispatcher: Optional[asyncio.Task] = None
+
+    def estimate(self, kind: str, prompt_tokens: int) -> int:
+        """Estimate the total tokens of a request from its prompt's token count."""
+        return round(
+            prompt_tokens
+            + self.prompt_overhead.get(kind, 0.0)
+            + self.completion_tokens.get(kind, self.default_completion_tokens)
+        )
+
+    def settle(
+        self,
+        kind: str,
+        prompt_tokens: int,
+        estimated_tokens: int,
+        counted_prompt_tokens: int,
+        counted_completion_tokens: int,
+    ) -> None:
+        """
+        Correct the token budget and estimates with a request's counted usage.
+
+        Args:
+            kind (str): Kind of request, e.g. its output schema.
+            prompt_tokens (int): Tokens of the prompt as passed to `estimate`.
+            estimated_tokens (int): Tokens reserved for the request.
+            counted_prompt_tokens (int): Prompt tokens counted for the request,
+                including any formatting added by the LLM client.
+            counted_completion_tokens (int): Completion tokens counted.
+        """
+        difference = counted_prompt_tokens + counted_completion_tokens
+        difference -= estimated_tokens
+        if difference > 0:
+            self.tokens.consume(difference)
+        else:
+            self.tokens.refund(-difference)
+
+        for estimates, observed in (
+            (self.prompt_overhead, counted_prompt_tokens - prompt_tokens),
+            (self.completion_tokens, counted_completion_tokens),
+        ):
+            if kind in estimates:
+                estimates[kind] += ESTIMATE_SMOOTHING * (observed - estimates[kind])
+            else:
+                estimates[kind] = float(observed)
+
+    async def acquire(self, key: str, tokens: int) -> float:
+        """
+        Wait until a request of `tokens` tokens fits the rate limits.
+
+        Args:
+            key (str): Requests with different keys are granted round-robin.
+            tokens (int): Estimated tokens of the request.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        # A request larger than the whole budget is let through once the
+        # bucket is full, as it would otherwise never be granted.
+        tokens = min(tokens, self.tokens.capacity)
+        if not self.queues and self.__fits(tokens):
+            self.__consume(tokens)
+            return 0.0
+
+        start_time = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(key, deque()).append((tokens, future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.ensure_future(self.__dispatch())
+        try:
+            await future
+        except asyncio.CancelledError:
+            self.__remove(key, future)
+            raise
+        return time.perf_counter() - start_time
+
+    def __fits(self, tokens: int) -> bool:
+        return self.requests.time_until(1) == 0 and self.tokens.time_until(tokens) == 0
+
+    def __consume(self, tokens: int) -> None:
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+
+    def __remove(self, key: str, future: asyncio.Future) -> None:
+        queue = self.queues.get(key)
+        if queue is None:
+            return
+        for entry in queue:
+            if entry[1] is future:
+                queue.remove(entry)
+                break
+        if not queue:
+            del self.queues[key]
+
+    async def __dispatch(self) -> None:
+        """Grant waiting requests round-robin across keys as the budget refills."""
+        while self.queues:
+            key, queue = next(iter(self.queues.items()))
+            tokens, future = queue[0]
+            if not future.done():
+                wait = max(self.requests.time_until(1), self.tokens.time_until(tokens))
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                self.__consume(tokens)
+                future.set_result(None)
+            # The key moves to the back of the rotation after each grant.
+            queue.popleft()
+            del self.queues[key]
+            if queue:
+                self.queues[key] = queue
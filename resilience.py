@@ -0,0 +1,382 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Optional,
+    TypeVar,
+)
+
+import httpx
+import numpy as np
+
+from config import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_WINDOW,
+    MAX_RETRIES,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+)
+from tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+# Entered around each attempt of a call, e.g. to wait for rate limit budget.
+Admission = Callable[[], AsyncContextManager[Any]]
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a backend whose circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a request error is transient: a connection failure, a timeout or
+    a rate limit or server error status.
+
+    SDK errors wrap the underlying httpx error, so the whole cause chain is
+    checked.
+    """
+    while error is not None:
+        if isinstance(error, (httpx.TransportError, TimeoutError, ConnectionError)):
+            return True
+        status_code = getattr(error, "status_code", None)
+        if status_code is None and isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+        if status_code in RETRYABLE_STATUS_CODES:
+            return True
+        error = error.__cause__
+    return False
+
+
+@asynccontextmanager
+async def deadline(seconds: Optional[float]) -> AsyncIterator[None]:
+    """
+    Cancel the block with a `TimeoutError` if it runs longer than `seconds`.
+
+    Retries inside the block are not started if their backoff would end after
+    the deadline. Nested deadlines keep the earliest one; None sets no limit.
+    """
+    if seconds is None:
+        yield
+        return
+    expires_at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(expires_at if outer is None else min(outer, expires_at))
+    try:
+        async with asyncio.timeout(seconds):
+            yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds until the current deadline, or None without one."""
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+class LatencyTracker:
+    """Recent latencies of one kind of request, for percentile-based hedging."""
+
+    def __init__(self, window: int = HEDGE_WINDOW):
+        self.latencies: deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float) -> None:
+        self.latencies.append(latency)
+
+    def percentile(self, percentile: float, min_samples: int) -> Optional[float]:
+        """The latency percentile, or None until `min_samples` were recorded."""
+        if len(self.latencies) < min_samples:
+            return None
+        return float(np.percentile(self.latencies, percentile))
+
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated transient failures of a backend.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    raise `CircuitOpenError` without reaching the backend. Once
+    `reset_seconds` have passed, one trial call is let through: its success
+    closes the circuit, and its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_progress):
+            raise CircuitOpenError(
+                f"Circuit for {self.name} is open after {self.failures} "
+                "consecutive failures"
+            )
+        if state == "half_open":
+            self.trial_in_progress = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_progress = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Opening circuit for {self.name}")
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class CallStats:
+    """What it took to complete one call through a `ResiliencePolicy`."""
+
+    hedged_requests: int = 0
+    retries: int = 0
+
+
+class ResiliencePolicy:
+    """
+    Hedging, jittered retries and a circuit breaker around calls to one backend.
+
+    A policy is shared by every explainer in a process, so that latency
+    percentiles and breaker state reflect all of the backend's traffic.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hedging: bool = True,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+        max_retries: int = MAX_RETRIES,
+        retry_base_delay: float = RETRY_BASE_DELAY,
+        retry_max_delay: float = RETRY_MAX_DELAY,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = breaker or CircuitBreaker(name)
+        self.trackers: dict[str, LatencyTracker] = {}
+        self.rng = random.Random()
+
+    def __tracker(self, kind: str) -> LatencyTracker:
+        if kind not in self.trackers:
+            self.trackers[kind] = LatencyTracker()
+        return self.trackers[kind]
+
+    def hedge_delay(self, kind: str) -> Optional[float]:
+        """Seconds after which a request of this kind gets a backup request."""
+        if not self.hedging:
+            return None
+        return self.__tracker(kind).percentile(
+            self.hedge_percentile, self.hedge_min_samples
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff before the given retry."""
+        cap = min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+        return self.rng.uniform(0, cap)
+
+    async def __attempt(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        kind: str,
+        admission: Optional[Admission] = None,
+        admitted: Optional[asyncio.Event] = None,
+    ) -> T:
+        """
+        Run one request and record its latency, failing fast on an open circuit.
+
+        The request is sent within `admission`, and its latency is measured
+        from when it was admitted, which sets `admitted`.
+        """
+        self.breaker.before_call()
+        try:
+            async with admission() if admission is not None else nullcontext():
+                if admitted is not None:
+                    admitted.set()
+                start_time = time.perf_counter()
+                result = await factory()
+        except asyncio.CancelledError:
+            # A hedged request that lost the race says nothing about the backend.
+            self.breaker.trial_in_progress = False
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        self.__tracker(kind).record(time.perf_counter() - start_time)
+        return result
+
+    async def __hedged(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        kind: str,
+        stats: CallStats,
+        admission: Optional[Admission],
+    ) -> T:
+        """Run a request and, if it is slow, a backup; the first success wins."""
+        delay = self.hedge_delay(kind)
+        admitted = asyncio.Event()
+        tasks = [
+            asyncio.ensure_future(self.__attempt(factory, kind, admission, admitted))
+        ]
+        start_time = time.perf_counter()
+        try:
+            if delay is not None:
+                # The delay starts once the request was admitted, so that a
+                # request waiting for rate limit budget does not get a backup.
+                waiter = asyncio.ensure_future(admitted.wait())
+                try:
+                    await asyncio.wait(
+                        [tasks[0], waiter], return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    waiter.cancel()
+                start_time = time.perf_counter()
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    stats.hedged_requests += 1
+                    tasks.append(
+                        asyncio.ensure_future(self.__attempt(factory, kind, admission))
+                    )
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0] and not tasks[0].done():
+                            # The original request is cancelled unfinished, so
+                            # it is recorded as taking at least until now.
+                            # Recording only the winners would drag the
+                            # percentile down with every hedge.
+                            self.__tracker(kind).record(
+                                time.perf_counter() - start_time
+                            )
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(
+        self,
+        factory: Callable[[], Awaitable[T]],
+        kind: str = "default",
+        hedge: bool = True,
+        retry: bool = True,
+        admission: Optional[Admission] = None,
+    ) -> tuple[T, CallStats]:
+        """
+        Call a backend through the policy.
+
+        Args:
+            factory (Callable): Starts a new request each time it is called.
+            kind (str): Requests of one kind share latency percentiles, e.g.
+                completions of one output schema.
+            hedge (bool): Whether a slow request may get a backup request.
+            retry (bool): Whether transient failures are retried.
+            admission (Callable, optional): Context entered around every
+                request, retries and backups included, e.g. to wait for rate
+                limit budget before each one.
+
+        Returns:
+            tuple: The result, and the hedged requests and retries it took.
+        """
+        stats = CallStats()
+        attempt = 0
+        while True:
+            try:
+                if hedge:
+                    result = await self.__hedged(factory, kind, stats, admission)
+                else:
+                    result = await self.__attempt(factory, kind, admission)
+                break
+            except Exception as e:
+                if not retry or attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                remaining = remaining_time()
+                if remaining is not None and delay >= remaining:
+                    raise
+                attempt += 1
+                stats.retries += 1
+                logger.warning(
+                    f"{self.name} request failed ({type(e).__name__}: {e}); "
+                    f"retry {attempt}/{self.max_retries} in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+        request_span = current_span()
+        if request_span is not None and (stats.hedged_requests or stats.retries):
+            request_span.set_attributes(
+                hedged_requests=stats.hedged_requests, retries=stats.retries
+            )
+        return result, stats
+
+
+def call_with(
+    policy: Optional[ResiliencePolicy],
+    factory: Callable[[], Awaitable[T]],
+    **kwargs: Any,
+) -> Awaitable[tuple[T, CallStats]]:
+    """Call through a policy, or directly when resilience is disabled."""
+    if policy is not None:
+        return policy.call(factory, **kwargs)
+
+    admission = kwargs.get("admission")
+
+    async def direct() -> tuple[T, CallStats]:
+        async with admission() if admission is not None else nullcontext():
+            return await factory(), CallStats()
+
+    return direct()
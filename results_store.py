@@ -0,0 +1,339 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import asdict
+from typing import Any, Iterator, Optional
+
+from models import ExperimentResult, StageMetrics
+
+logger = logging.getLogger(__name__)
+
+
+RESULTS_FILE = "results.jsonl"
+INDEX_FILE = "index.sqlite3"
+BLOB_DIR = "blobs"
+RESULT_FILE_PATTERN = re.compile(r"attack_(\d+)_([A-Z_]+)\.json$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    offset INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL,
+    attack_id INTEGER NOT NULL,
+    variant TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (attack_id, variant, timestamp);
+CREATE INDEX IF NOT EXISTS results_time ON results (timestamp);
+CREATE TABLE IF NOT EXISTS watermark (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    indexed_end INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO watermark VALUES (0, 0);
+"""
+
+
+class ResultsStore:
+    """
+    Append-only store of experiment results in a directory.
+
+    Each result is one compact JSON line in `results.jsonl`. The prompt and
+    context node texts, which repeat across variants and reruns, are stored
+    once each as content-addressed blobs and referenced by their SHA-256.
+    `index.sqlite3` maps attack ID, variant and timestamp to the offset of
+    each line, so scans read only the lines they select.
+
+    Appends take an exclusive lock on the results file, so any number of
+    threads and processes can write to one store. The index is updated after
+    each append. Reads index every line past a watermark, up to which all
+    lines are known to be indexed, so lines that a crashed writer left
+    unindexed are indexed by the next read even if later lines already are.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.results_path = os.path.join(path, RESULTS_FILE)
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.blob_dir = os.path.join(path, BLOB_DIR)
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+        with closing(self.__connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def __connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=self.timeout)
+
+    def __blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def put_blob(self, text: str) -> str:
+        """Store a text once and return its SHA-256."""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.__blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get_blob(self, digest: str) -> str:
+        with open(self.__blob_path(digest), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def append(
+        self, result: ExperimentResult, timestamp: Optional[float] = None
+    ) -> dict[str, Any]:
+        """
+        Append a result to the store.
+
+        Returns:
+            dict: The stored record, with blob hashes in place of the prompt
+            and context node texts.
+        """
+        record = asdict(result)
+        record["timestamp"] = timestamp if timestamp is not None else time.time()
+        record["prompt"] = self.put_blob(result.prompt)
+        record["context_nodes"] = [self.put_blob(text) for text in result.context_nodes]
+        line = (json.dumps(record, separators=(",", ":"), default=str) + "\n").encode(
+            "utf-8"
+        )
+
+        with self.lock, open(self.results_path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                if offset:
+                    f.seek(offset - 1)
+                    if f.read(1) != b"\n":
+                        # End the line of a writer that crashed mid-line, so
+                        # that this one is not appended to it.
+                        f.write(b"\n")
+                        offset += 1
+                f.write(line)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        with closing(self.__connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)",
+                (
+                    offset,
+                    len(line),
+                    result.attack_id,
+                    result.variant,
+                    record["timestamp"],
+                ),
+            )
+        return record
+
+    def __catch_up(self, conn: sqlite3.Connection) -> None:
+        """Index the complete lines past the watermark, and advance it."""
+        if not os.path.exists(self.results_path):
+            return
+        (indexed_end,) = conn.execute("SELECT indexed_end FROM watermark").fetchone()
+        if indexed_end >= os.path.getsize(self.results_path):
+            return
+        rows = []
+        with open(self.results_path, "rb") as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Left incomplete by a writer that crashed mid-line
+                    logger.warning(f"Skipping corrupt line at offset {offset}")
+                else:
+                    rows.append(
+                        (
+                            offset,
+                            len(line),
+                            record["attack_id"],
+                            record["variant"],
+                            record["timestamp"],
+                        )
+                    )
+                offset += len(line)
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "UPDATE watermark SET indexed_end = MAX(indexed_end, ?)", (offset,)
+            )
+
+    def __read(self, locations: list[tuple[int, int]]) -> Iterator[dict[str, Any]]:
+        with open(self.results_path, "rb") as f:
+            for offset, length in locations:
+                f.seek(offset)
+                yield json.loads(f.read(length))
+
+    def scan(
+        self,
+        attack_ids: Optional[list[int]] = None,
+        variants: Optional[list[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Yield the stored records matching all given criteria, oldest first.
+
+        Records reference the prompt and context by blob hash; see `resolve`.
+        """
+        conditions, params = [], []
+        if attack_ids is not None:
+            conditions.append(f"attack_id IN ({','.join('?' * len(attack_ids))})")
+            params.extend(attack_ids)
+        if variants is not None:
+            conditions.append(f"variant IN ({','.join('?' * len(variants))})")
+            params.extend(variants)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with closing(self.__connect()) as conn:
+            self.__catch_up(conn)
+            locations = conn.execute(
+                f"SELECT offset, length FROM results {where} "
+                "ORDER BY timestamp, offset",
+                params,
+            ).fetchall()
+        if locations:
+            yield from self.__read(locations)
+
+    def records(self) -> Iterator[dict[str, Any]]:
+        """Yield every complete record in append order, in one sequential read."""
+        if not os.path.exists(self.results_path):
+            return
+        with open(self.results_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Left corrupt by a crashed writer; see `__catch_up`
+                yield record
+
+    def latest(self) -> Iterator[dict[str, Any]]:
+        """Yield the most recent record of each attack and variant."""
+        with closing(self.__connect()) as conn:
+            self.__catch_up(conn)
+            # SQLite returns the other columns of the row holding the MAX.
+            locations = conn.execute(
+                "SELECT offset, length, MAX(timestamp) FROM results "
+                "GROUP BY attack_id, variant ORDER BY attack_id, variant"
+            ).fetchall()
+        if locations:
+            yield from self.__read(
+                [(offset, length) for offset, length, _ in locations]
+            )
+
+    def resolve(self, record: dict[str, Any]) -> dict[str, Any]:
+        """Replace the blob hashes of a record with the texts they refer to."""
+        return {
+            **record,
+            "prompt": self.get_blob(record["prompt"]),
+            "context_nodes": [
+                self.get_blob(digest) for digest in record["context_nodes"]
+            ],
+        }
+
+    def export_json(self, output_dir: str) -> int:
+        """
+        Write the latest result of each attack and variant as one JSON file,
+        in the layout of `ICSAnomalyExplainer.save_results` before the store.
+
+        Returns:
+            int: The number of files written.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        count = 0
+        for record in self.latest():
+            result = self.resolve(record)
+            del result["timestamp"]
+            output_file = os.path.join(
+                output_dir, f"attack_{result['attack_id']}_{result['variant']}.json"
+            )
+            with open(output_file, "w") as f:
+                json.dump(result, f, indent=2, default=str)
+            count += 1
+        return count
+
+    def import_json(self, input_dir: str) -> int:
+        """
+        Append per-run JSON result files, timestamped with their modification time.
+
+        Returns:
+            int: The number of results imported.
+        """
+        count = 0
+        for path in sorted(glob.glob(os.path.join(input_dir, "attack_*.json"))):
+            if not RESULT_FILE_PATTERN.search(os.path.basename(path)):
+                continue
+            with open(path, "r") as f:
+                data = json.load(f)
+            data["stages"] = [StageMetrics(**stage) for stage in data["stages"]]
+            self.append(ExperimentResult(**data), timestamp=os.path.getmtime(path))
+            count += 1
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage an experiment results store")
+    parser.add_argument(
+        "command",
+        choices=["export", "import"],
+        help="export: write the latest result per attack and variant as JSON files; "
+        "import: append existing JSON result files to the store",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default="output/experiment-results/",
+        help="Directory of the results store",
+    )
+    parser.add_argument(
+        "--json-dir",
+        type=str,
+        default=None,
+        help="Directory of the JSON result files (default: the store directory)",
+    )
+    args = parser.parse_args()
+
+    store = ResultsStore(args.store)
+    json_dir = args.json_dir or args.store
+    if args.command == "export":
+        count = store.export_json(json_dir)
+        logger.info(f"Exported {count} results to {json_dir}")
+    else:
+        count = store.import_json(json_dir)
+        logger.info(f"Imported {count} results from {json_dir}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
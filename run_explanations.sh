@@ -14,7 +14,5 @@ fi
 # Take attack index as an argument
 ATTACK_NUM="$1"
 
-# Run experiments for the specified attack and each variant
-for variant in "BASELINE" "NO_MITRE" "FULL"; do
-    python main.py --attack "$ATTACK_NUM" --variant "$variant" --output-dir "$OUTPUT_DIR"
-done
+# Run every variant for the specified attack in one process, sharing common stages
+python batch_runner.py --attacks "$ATTACK_NUM" --variants BASELINE NO_MITRE FULL --output-dir "$OUTPUT_DIR"
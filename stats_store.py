@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import closing
+from typing import Any
+
+from config import ANOMALY_STATS_DB, ANOMALY_STATS_FILE
+
+SCHEMA = """
+CREATE TABLE stats (
+    attack_number INTEGER PRIMARY KEY,
+    top_attribution TEXT,
+    value TEXT NOT NULL
+);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def source_signature(path: str) -> str:
+    """Identify a version of the JSON statistics file by its size and mtime."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def build_store(source: str, path: str) -> None:
+    """
+    Build the SQLite store from the JSON statistics written by process_anomalies.py.
+
+    The store is written to a temporary file and moved into place, so
+    concurrent readers see either the old or the new store, never a partial one.
+    """
+    signature = source_signature(source)
+    with open(source, "r") as f:
+        entries = json.load(f)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            conn.executescript(SCHEMA)
+            conn.executemany(
+                "INSERT OR REPLACE INTO stats VALUES (?, ?, ?)",
+                (
+                    (
+                        entry["attack_number"],
+                        entry.get("top_attribution"),
+                        json.dumps(entry),
+                    )
+                    for entry in entries
+                ),
+            )
+            conn.execute(
+                "INSERT INTO meta VALUES ('source_signature', ?)", (signature,)
+            )
+            conn.commit()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def is_stale(source: str, path: str) -> bool:
+    """Whether the store is missing or was built from another version of the source."""
+    if not os.path.exists(path):
+        return True
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = 'source_signature'"
+        ).fetchone()
+    return row is None or row[0] != source_signature(source)
+
+
+class AnomalyStatsStore:
+    """
+    Read-only anomaly statistics keyed by attack number.
+
+    Backed by a SQLite file built from `ANOMALY_STATS_FILE` and rebuilt when
+    that file changes, so one attack is looked up by primary key without
+    parsing the statistics of every other attack. A single store can be
+    shared by every explainer in a process.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+        self.lock = threading.Lock()
+
+    @classmethod
+    def open(
+        cls, path: str = ANOMALY_STATS_DB, source: str = ANOMALY_STATS_FILE
+    ) -> "AnomalyStatsStore":
+        """Open the store, first rebuilding it if the JSON source has changed."""
+        if not os.path.exists(source):
+            if not os.path.exists(path):
+                raise FileNotFoundError(
+                    f"Anomaly statistics not found: {source}; "
+                    "run process_anomalies.py first"
+                )
+        elif is_stale(source, path):
+            build_store(source, path)
+        return cls(path, source)
+
+    def get(self, attack_number: int) -> dict[str, Any]:
+        """
+        Return the statistics of one attack.
+
+        Raises:
+            KeyError: If the attack is not in the statistics file.
+            ValueError: If computing the statistics failed for the attack.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT top_attribution, value FROM stats WHERE attack_number = ?",
+                (attack_number,),
+            ).fetchone()
+        if row is None:
+            raise KeyError(
+                f"No anomaly statistics for attack {attack_number} in {self.source}"
+            )
+        top_attribution, value = row
+        if top_attribution is None:
+            raise ValueError(
+                f"Anomaly statistics for attack {attack_number} failed to compute; "
+                "see the process_anomalies.py log"
+            )
+        return json.loads(value)
+
+    def attack_numbers(self) -> list[int]:
+        """Return the attacks whose statistics were computed successfully."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT attack_number FROM stats "
+                "WHERE top_attribution IS NOT NULL ORDER BY attack_number"
+            ).fetchall()
+        return [attack_number for (attack_number,) in rows]
+
+    def close(self) -> None:
+        self.conn.close()
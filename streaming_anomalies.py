@@ -0,0 +1,390 @@
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import socket
+import sys
+import time
+from collections import deque
+from typing import Any, Callable, Iterator, Optional, TextIO
+
+from process_anomalies import fetch_detection_points, format_statistics
+
+logger = logging.getLogger(__name__)
+
+
+BASELINE_ROWS = 3_600  # One hour of SWaT data at one row per second
+DETECTION_GAP_ROWS = 60  # Undetected rows after which a detection ends
+POLL_INTERVAL = 0.5  # Seconds between reads of a file that has no new rows
+LABEL_COLUMN = "Normal/Attack"
+
+
+def parse_value(value: str) -> Any:
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def parse_lines(lines: Iterator[str]) -> Iterator[dict[str, Any]]:
+    """Parse CSV lines, the first of which is the header, into rows."""
+    header = None
+    for values in csv.reader(lines):
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        yield {name: parse_value(value) for name, value in zip(header, values)}
+
+
+def follow_lines(f: TextIO, follow: bool) -> Iterator[str]:
+    """Yield complete lines of a file, waiting for more at its end if `follow`."""
+    partial = ""
+    while True:
+        line = f.readline()
+        if not line:
+            if not follow:
+                break
+            time.sleep(POLL_INTERVAL)
+            continue
+        partial += line
+        if partial.endswith("\n"):
+            yield partial
+            partial = ""
+    if partial:
+        yield partial
+
+
+def tail_rows(path: str, follow: bool = True) -> Iterator[dict[str, Any]]:
+    """
+    Yield the rows of a SWAT CSV file, then the rows appended to it.
+
+    Args:
+        path (str): The CSV file, starting with its header.
+        follow (bool): Whether to keep waiting for appended rows at the end.
+    """
+    with open(path, "r", newline="") as f:
+        yield from parse_lines(follow_lines(f, follow))
+
+
+def socket_rows(host: str, port: int) -> Iterator[dict[str, Any]]:
+    """Yield the rows of a SWAT CSV stream served on a TCP socket, header first."""
+    with socket.create_connection((host, port)) as connection:
+        with connection.makefile("r", newline="") as f:
+            yield from parse_lines(f)
+
+
+class RollingStats:
+    """
+    Count, mean, std, min and max of the last `window` values.
+
+    The mean and variance are updated online with Welford's method, adding
+    each new value and removing the value that leaves the window. The min and
+    max are the fronts of monotonic deques. Every update takes amortised
+    constant time.
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque[float] = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum: deque[tuple[int, float]] = deque()
+        self.maximum: deque[tuple[int, float]] = deque()
+        self.position = 0
+        self.removals = 0
+
+    def push(self, value: float) -> None:
+        if len(self.values) == self.window:
+            self.__remove(self.values.popleft())
+        self.values.append(value)
+        delta = value - self.mean
+        self.mean += delta / len(self.values)
+        self.m2 += delta * (value - self.mean)
+
+        while self.minimum and self.minimum[-1][1] >= value:
+            self.minimum.pop()
+        self.minimum.append((self.position, value))
+        while self.maximum and self.maximum[-1][1] <= value:
+            self.maximum.pop()
+        self.maximum.append((self.position, value))
+        oldest = self.position - len(self.values)
+        for extremes in (self.minimum, self.maximum):
+            if extremes[0][0] <= oldest:
+                extremes.popleft()
+        self.position += 1
+
+    def __remove(self, value: float) -> None:
+        # Called after the value has left `values`
+        count = len(self.values)
+        if count == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / count
+        self.m2 -= delta * (value - self.mean)
+        # Removals accumulate rounding error, so the moments are recomputed
+        # from the window once every window's worth of removals.
+        self.removals += 1
+        if self.removals >= self.window:
+            self.removals = 0
+            remaining = list(self.values)
+            self.mean = math.fsum(remaining) / len(remaining)
+            self.m2 = math.fsum((v - self.mean) ** 2 for v in remaining)
+
+    def stats(self) -> tuple[float, float, float, float, int]:
+        """(mean, std, min, max, count), zero when empty as in `calculate_stats`."""
+        count = len(self.values)
+        if count == 0:
+            return (0.0, 0.0, 0.0, 0.0, 0)
+        std = math.sqrt(max(self.m2, 0.0) / count)
+        return (self.mean, std, self.minimum[0][1], self.maximum[0][1], count)
+
+
+class RunningStats:
+    """Count, mean, std, min and max of every value so far, updated online."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def push(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def stats(self) -> tuple[float, float, float, float, int]:
+        if self.count == 0:
+            return (0.0, 0.0, 0.0, 0.0, 0)
+        std = math.sqrt(max(self.m2, 0.0) / self.count)
+        return (self.mean, std, self.minimum, self.maximum, self.count)
+
+
+class StreamingAnomalyStatistics:
+    """
+    Anomaly statistics of a stream of SWAT rows, without reloading the data.
+
+    Outside a detection, each row's values enter a rolling baseline of the
+    last `baseline_rows` rows per component. A detection starts at the first
+    detected row: the baseline is frozen, and the detected rows are
+    accumulated until `detection_gap` rows in a row are not detected.
+
+    As in `compute_anomaly_statistics`, the baseline leaves out the row just
+    before the detection window, and undetected rows within the window are in
+    neither the baseline nor the detected statistics.
+    """
+
+    def __init__(
+        self,
+        components: list[str],
+        baseline_rows: int = BASELINE_ROWS,
+        detection_gap: int = DETECTION_GAP_ROWS,
+    ):
+        self.components = components
+        self.detection_gap = detection_gap
+        self.baselines = {name: RollingStats(baseline_rows) for name in components}
+        self.detected: Optional[dict[str, RunningStats]] = None
+        self.pending: Optional[dict[str, Any]] = None
+        self.rows = 0
+        self.detection_start: Optional[int] = None
+        self.undetected_rows = 0
+
+    @property
+    def in_detection(self) -> bool:
+        return self.detected is not None
+
+    def update(self, row: dict[str, Any], detected: bool) -> Optional[dict[str, Any]]:
+        """
+        Add a row to the baseline or the current detection.
+
+        Returns:
+            dict: The final statistics of the detection this row ends, if any.
+        """
+        row_number = self.rows
+        self.rows += 1
+        if detected:
+            if self.detected is None:
+                self.detected = {name: RunningStats() for name in self.components}
+                self.detection_start = row_number
+                self.pending = None
+            for name, stats in self.detected.items():
+                stats.push(row[name])
+            self.undetected_rows = 0
+            return None
+
+        if self.detected is not None:
+            self.undetected_rows += 1
+            if self.undetected_rows < self.detection_gap:
+                return None
+            statistics = self.statistics()
+            self.detected = None
+            self.detection_start = None
+            self.undetected_rows = 0
+            return statistics
+
+        # Each row enters the baseline one row late, so that the row before
+        # a detection is left out.
+        if self.pending is not None:
+            for name, stats in self.baselines.items():
+                stats.push(self.pending[name])
+        self.pending = row
+        return None
+
+    def statistics(self) -> dict[str, Any]:
+        """
+        The statistics of the current detection so far.
+
+        Returns:
+            dict: The detection's first row and row count, and the
+            `baseline_stats`, `detected_stats` and `detected_change_percent` of
+            each component. Components whose baseline mean is zero are left out.
+        """
+        if self.detected is None:
+            raise RuntimeError("No detection in progress")
+        statistics = {}
+        for name in self.components:
+            try:
+                statistics[name] = format_statistics(
+                    self.baselines[name].stats(), self.detected[name].stats()
+                )
+            except ZeroDivisionError:
+                logger.warning(f"Zero baseline mean of {name}")
+        first_component = self.detected[self.components[0]]
+        return {
+            "start_row": self.detection_start,
+            "detected_rows": first_component.count,
+            "statistics": statistics,
+        }
+
+
+def label_detector(label_column: str) -> Callable[[int, dict[str, Any]], bool]:
+    """Treat rows labelled as attacks in the data as detected."""
+    # Some SWAT releases label attacks "A ttack".
+    return lambda row_number, row: (
+        str(row.get(label_column, "")).replace(" ", "") == "Attack"
+    )
+
+
+def points_detector(points: set[int]) -> Callable[[int, dict[str, Any]], bool]:
+    """Treat the rows at the given positions in the stream as detected."""
+    return lambda row_number, row: row_number in points
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute anomaly statistics from a live stream of SWAT rows"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--file", type=str, help="SWAT CSV file to read and follow as it grows"
+    )
+    source.add_argument(
+        "--socket", type=str, help="host:port of a TCP server streaming SWAT CSV"
+    )
+    parser.add_argument(
+        "--no-follow",
+        action="store_true",
+        help="Stop at the end of --file instead of waiting for new rows",
+    )
+    parser.add_argument(
+        "--components",
+        nargs="+",
+        required=True,
+        help="SWAT columns to compute the statistics of",
+    )
+    parser.add_argument(
+        "--attack",
+        type=int,
+        default=None,
+        help="Use this attack's detection points as the detected rows "
+        f"(default: rows labelled Attack in {LABEL_COLUMN})",
+    )
+    parser.add_argument(
+        "--baseline-rows",
+        type=int,
+        default=BASELINE_ROWS,
+        help="Rows in the rolling baseline",
+    )
+    parser.add_argument(
+        "--detection-gap",
+        type=int,
+        default=DETECTION_GAP_ROWS,
+        help="Undetected rows after which a detection ends",
+    )
+    parser.add_argument(
+        "--emit-every",
+        type=int,
+        default=0,
+        help="Also emit the statistics every N detected rows (default: at the end)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="JSONL file to append the statistics to (default: stdout)",
+    )
+    args = parser.parse_args()
+
+    if args.file:
+        rows = tail_rows(args.file, follow=not args.no_follow)
+    else:
+        host, port = args.socket.rsplit(":", 1)
+        rows = socket_rows(host, int(port))
+    if args.attack is not None:
+        points = fetch_detection_points()[args.attack]
+        is_detected = points_detector({int(point) for point in points})
+    else:
+        is_detected = label_detector(LABEL_COLUMN)
+
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        output = open(args.output, "a")
+    else:
+        output = sys.stdout
+
+    def emit(statistics: dict[str, Any], final: bool) -> None:
+        output.write(json.dumps({**statistics, "final": final}) + "\n")
+        output.flush()
+
+    stream = StreamingAnomalyStatistics(
+        args.components, args.baseline_rows, args.detection_gap
+    )
+    try:
+        for row_number, row in enumerate(rows):
+            detected = is_detected(row_number, row)
+            statistics = stream.update(row, detected)
+            if statistics is not None:
+                emit(statistics, final=True)
+            elif (
+                detected
+                and args.emit_every
+                and stream.detected[args.components[0]].count % args.emit_every == 0
+            ):
+                emit(stream.statistics(), final=False)
+        if stream.in_detection:
+            emit(stream.statistics(), final=True)
+    except KeyboardInterrupt:
+        logger.info("Stopped")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
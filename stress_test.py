@@ -55,14 +55,17 @@ from config import (
     LLAMA_PROJECT_NAME,
     OPENAI_MODEL,
     OPENAI_TEMPERATURE,
+    TRACE_FILE,
+    TRACING_ENABLED,
 )
 from process_anomalies import (
     ATTRIBUTIONS_FILE,
     OUTPUT_DIR,
-    compute_anomaly_statistics,
+    compute_feature_statistics,
     fetch_detection_points,
     retrieve_swat_data,
 )
+from tracing import configure_tracing, span
 
 load_dotenv()
 
@@ -113,13 +116,14 @@ class ExplanationOutput(BaseModel):
 
 def prepare_anomaly_statistics(attribution, detection_points, df_test):
     anomaly_statistics = dict()
-    for attr in tqdm(attribution["attributions"], desc="Processing attributions"):
-        component = attr["feature"]
-        statistics = compute_anomaly_statistics(
+    components = [attr["feature"] for attr in attribution["attributions"]]
+    with span("anomaly_statistics.compute", components=len(components)):
+        feature_statistics = compute_feature_statistics(
             detection_points=detection_points[attribution["attack_number"]],
             test_dataset=df_test,
-            component_name=component,
+            features=components,
         )
+    for component, statistics in feature_statistics.items():
         baseline = statistics["baseline_stats"]
         detected = statistics["detected_stats"]
         change_direction = "↑" if detected["mean"] > baseline["mean"] else "↓"
@@ -157,7 +161,9 @@ def prepare_documents(attribution, index):
             rerank_top_n=TOP_K,
             filters=MetadataFilters(filters=filters, condition=FilterCondition.OR),
         )
-        documents[feature] = retriever.retrieve(feature)
+        with span("retrieval.request", query=feature, filtered=True) as request_span:
+            documents[feature] = retriever.retrieve(feature)
+            request_span.set_attribute("retrieved_docs", len(documents[feature]))
     return documents
 
 
@@ -196,6 +202,11 @@ def main():
         choices=["IDEAL", "COMPLEX", "TOP"],
         help="Variant to run: IDEAL, COMPLEX, or TOP",
     )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help=f"Export nested timing spans to {TRACE_FILE}",
+    )
     parser.add_argument(
         "--output-dir",
         type=str,
@@ -206,39 +217,56 @@ def main():
 
     os.makedirs(args.output_dir, exist_ok=True)
     output_path = os.path.join(args.output_dir, args.variant + ".json")
+    if args.trace or TRACING_ENABLED:
+        configure_tracing(TRACE_FILE)
+
+    with span("stress_test", attack_id=ATTACK_INDEX, variant=args.variant):
+        with span("clients.create"):
+            LLM = OpenAI(
+                model=OPENAI_MODEL,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                temperature=OPENAI_TEMPERATURE,
+            )
+            INDEX = LlamaCloudIndex(
+                LLAMA_INDEX_NAME,
+                project_name=LLAMA_PROJECT_NAME,
+                api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
+            )
 
-    LLM = OpenAI(
-        model=OPENAI_MODEL,
-        api_key=os.getenv("OPENAI_API_KEY"),
-        temperature=OPENAI_TEMPERATURE,
-    )
-    INDEX = LlamaCloudIndex(
-        LLAMA_INDEX_NAME,
-        project_name=LLAMA_PROJECT_NAME,
-        api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
-    )
-
-    detection_points = fetch_detection_points()
-    df_test = retrieve_swat_data("test")
-    attribution = json.load(open(os.path.join(OUTPUT_DIR, ATTRIBUTIONS_FILE), "r"))[
-        ATTACK_INDEX
-    ]
+        with span("data.load"):
+            detection_points = fetch_detection_points()
+            attribution = json.load(
+                open(os.path.join(OUTPUT_DIR, ATTRIBUTIONS_FILE), "r")
+            )[ATTACK_INDEX]
+            df_test = retrieve_swat_data(
+                "test",
+                columns=[attr["feature"] for attr in attribution["attributions"]],
+            )
 
-    anomaly_statistics = prepare_anomaly_statistics(
-        attribution, detection_points, df_test
-    )
-    documents = prepare_documents(attribution, INDEX)
+        with span("anomaly_statistics"):
+            anomaly_statistics = prepare_anomaly_statistics(
+                attribution, detection_points, df_test
+            )
+        with span("stage.document_retrieval"):
+            documents = prepare_documents(attribution, INDEX)
 
-    prompt = build_prompt(args.variant, attribution, documents, anomaly_statistics)
-    logger.info(f"Generated prompt:\n{prompt}")
+        with span("prompt.build") as prompt_span:
+            prompt = build_prompt(
+                args.variant, attribution, documents, anomaly_statistics
+            )
+            prompt_span.set_attribute("prompt_chars", len(prompt))
+        logger.info(f"Generated prompt:\n{prompt}")
 
-    response = LLM.as_structured_llm(output_cls=ExplanationOutput).complete(
-        prompt=prompt
-    )
-    explanation = ExplanationOutput.model_validate(json.loads(response.text))
+        with span("llm.request", model=OPENAI_MODEL, output_schema="ExplanationOutput"):
+            response = LLM.as_structured_llm(output_cls=ExplanationOutput).complete(
+                prompt=prompt
+            )
+        with span("parse", output_schema="ExplanationOutput"):
+            explanation = ExplanationOutput.model_validate(json.loads(response.text))
 
-    with open(output_path, "w") as f:
-        json.dump(explanation.model_dump(), f, indent=2)
+        with span("save_results"):
+            with open(output_path, "w") as f:
+                json.dump(explanation.model_dump(), f, indent=2)
 
     logger.info(f"Output written to {output_path}")
 
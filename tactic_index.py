@@ -0,0 +1,194 @@
+import argparse
+import json
+import logging
+import os
+from collections import defaultdict
+
+import numpy as np
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+from config import LOCAL_INDEX_DIR, TACTIC_INDEX_DIR
+from local_index import HashingEmbedding, LocalHybridIndex, load_chunks
+
+logger = logging.getLogger(__name__)
+
+
+TACTICS_FILE = "tactics.json"
+NODES_FILE = "nodes.jsonl"
+CENTROIDS_FILE = "centroids.npy"
+VECTORS_FILE = "vectors.npy"
+
+
+def is_attack_technique(node: BaseNode) -> bool:
+    return (
+        node.metadata.get("source") == "MITRE_ICS"
+        and node.metadata.get("doc_type") == "attack_technique"
+    )
+
+
+class TacticIndex:
+    """
+    Offline index of MITRE ICS attack-technique chunks grouped by tactic.
+
+    Each tactic is represented by the normalised centroid of its technique
+    vectors, so the most relevant tactics for an anomaly can be ranked by
+    similarity to the SWaT context instead of asking the LLM to choose them.
+    """
+
+    def __init__(
+        self,
+        tactics: list[str],
+        members: list[list[int]],
+        nodes: list[BaseNode],
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        embedding: HashingEmbedding,
+    ):
+        self.tactics = tactics
+        self.members = members
+        self.nodes = nodes
+        self.vectors = vectors
+        self.centroids = centroids
+        self.embedding = embedding
+
+    @classmethod
+    def build(cls, nodes: list[BaseNode], embedding: HashingEmbedding) -> "TacticIndex":
+        """Group the attack-technique chunks by tactic and compute centroids."""
+        techniques = [node for node in nodes if is_attack_technique(node)]
+        if not techniques:
+            raise ValueError("No MITRE ICS attack_technique chunks to index")
+
+        groups: dict[str, list[int]] = defaultdict(list)
+        for position, node in enumerate(techniques):
+            tactic = node.metadata.get("tactic")
+            for name in tactic if isinstance(tactic, list) else [tactic]:
+                if name:
+                    groups[name].append(position)
+
+        vectors = embedding.embed([node.get_content() for node in techniques])
+        tactics = sorted(groups)
+        centroids = np.stack(
+            [vectors[groups[tactic]].mean(axis=0) for tactic in tactics]
+        )
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        return cls(
+            tactics=tactics,
+            members=[groups[tactic] for tactic in tactics],
+            nodes=techniques,
+            vectors=vectors,
+            centroids=centroids,
+            embedding=embedding,
+        )
+
+    def persist(self, persist_dir: str) -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        np.save(os.path.join(persist_dir, VECTORS_FILE), self.vectors)
+        np.save(os.path.join(persist_dir, CENTROIDS_FILE), self.centroids)
+        with open(os.path.join(persist_dir, NODES_FILE), "w") as f:
+            for node in self.nodes:
+                f.write(json.dumps(doc_to_json(node)) + "\n")
+        with open(os.path.join(persist_dir, TACTICS_FILE), "w") as f:
+            json.dump(
+                {
+                    "embedding_dim": self.embedding.dim,
+                    "tactics": self.tactics,
+                    "members": self.members,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "TacticIndex":
+        if not os.path.exists(os.path.join(persist_dir, TACTICS_FILE)):
+            raise FileNotFoundError(f"Tactic index not found: {persist_dir}")
+        with open(os.path.join(persist_dir, TACTICS_FILE), "r") as f:
+            settings = json.load(f)
+        with open(os.path.join(persist_dir, NODES_FILE), "r") as f:
+            nodes = [json_to_doc(json.loads(line)) for line in f]
+        return cls(
+            tactics=settings["tactics"],
+            members=settings["members"],
+            nodes=nodes,
+            vectors=np.load(os.path.join(persist_dir, VECTORS_FILE), mmap_mode="r"),
+            centroids=np.load(os.path.join(persist_dir, CENTROIDS_FILE)),
+            embedding=HashingEmbedding(dim=settings["embedding_dim"]),
+        )
+
+    def rank_tactics(self, context: str, k: int = 3) -> list[tuple[str, float]]:
+        """Rank tactics by cosine similarity between the context and centroids."""
+        similarities = self.centroids @ self.embedding.embed([context])[0]
+        ranking = np.argsort(-similarities, kind="stable")[:k]
+        return [(self.tactics[i], float(similarities[i])) for i in ranking]
+
+    def retrieve(
+        self, context: str, tactics: list[str], top_k: int = 3
+    ) -> list[NodeWithScore]:
+        """Return the techniques of the given tactics most similar to the context."""
+        positions = sorted(
+            {
+                position
+                for tactic in tactics
+                if tactic in self.tactics
+                for position in self.members[self.tactics.index(tactic)]
+            }
+        )
+        if not positions:
+            return []
+        similarities = self.vectors[positions] @ self.embedding.embed([context])[0]
+        ranking = np.argsort(-similarities, kind="stable")[:top_k]
+        return [
+            NodeWithScore(node=self.nodes[positions[i]], score=float(similarities[i]))
+            for i in ranking
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the MITRE tactic index used by the FULL_FAST variant"
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--input",
+        type=str,
+        help='JSONL file with one {"text": ..., "metadata": {...}} chunk per line',
+    )
+    source.add_argument(
+        "--local-index-dir",
+        type=str,
+        default=LOCAL_INDEX_DIR,
+        help="Read the chunks from a local hybrid index instead",
+    )
+    parser.add_argument(
+        "--persist-dir",
+        type=str,
+        default=TACTIC_INDEX_DIR,
+        help="Directory to write the tactic index to",
+    )
+    parser.add_argument(
+        "--embedding-dim",
+        type=int,
+        default=512,
+        help="Dimension of the hashed dense vectors",
+    )
+    args = parser.parse_args()
+
+    if args.input:
+        nodes = load_chunks(args.input)
+    else:
+        nodes = LocalHybridIndex.load(args.local_index_dir).nodes
+    index = TacticIndex.build(nodes, HashingEmbedding(dim=args.embedding_dim))
+    index.persist(args.persist_dir)
+    logger.info(
+        f"Indexed {len(index.nodes)} techniques across {len(index.tactics)} tactics "
+        f"to {args.persist_dir}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()
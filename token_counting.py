@@ -0,0 +1,153 @@
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Optional
+
+import tiktoken
+from llama_index.core.callbacks import CBEventType, TokenCountingHandler
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import TokenCountingEvent
+
+from config import LLM_BACKEND, MOCK_CHARS_PER_TOKEN, OPENAI_MODEL, TIKTOKEN_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+_active_counter: ContextVar[Optional[TokenCountingHandler]] = ContextVar(
+    "active_token_counter", default=None
+)
+
+
+class RequestTokenCountingHandler(BaseCallbackHandler):
+    """
+    Callback handler that forwards token events to the counter of the current request.
+
+    A single LLM is shared by every concurrent run, so one global
+    TokenCountingHandler would mix the counts of interleaved requests. Each
+    request instead binds its own counter with `count_tokens()`, and since
+    contextvars are copied into every asyncio task, events raised while that
+    request is awaited are routed to its counter only.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        counter = _active_counter.get()
+        if counter is not None:
+            counter.on_event_end(event_type, payload=payload, event_id=event_id)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[dict[str, list[str]]] = None,
+    ) -> None:
+        pass
+
+
+def approximate_encode(text: str) -> list[int]:
+    """Split text into pseudo-tokens of `MOCK_CHARS_PER_TOKEN` characters."""
+    return list(range(0, len(text), MOCK_CHARS_PER_TOKEN))
+
+
+def get_tokenizer() -> Callable[[str], list[int]]:
+    """
+    Return the tiktoken encoder of the configured OpenAI model.
+
+    The mock LLM backend has no tokenizer of its own and must run offline, so
+    it gets `approximate_encode` instead. For OpenAI, the BPE file is read
+    from `TIKTOKEN_CACHE_DIR` (unless the environment variable of the same
+    name points elsewhere) and only downloaded if it is not cached there yet.
+    tiktoken keeps loaded encodings, so only the first call is slow.
+    """
+    if LLM_BACKEND == "mock":
+        return approximate_encode
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    try:
+        return tiktoken.encoding_for_model(OPENAI_MODEL).encode
+    except OSError as e:
+        raise RuntimeError(
+            f"Could not load the {OPENAI_MODEL} tokenizer from "
+            f"{os.environ['TIKTOKEN_CACHE_DIR']}; run `python token_counting.py` "
+            "with network access to cache it"
+        ) from e
+
+
+def encode(text: str) -> list[int]:
+    """Tokenize text, loading the tokenizer on first use."""
+    return get_tokenizer()(text)
+
+
+@contextmanager
+def count_tokens() -> Iterator[TokenCountingHandler]:
+    """Bind a fresh token counter to the LLM requests made inside the block."""
+    # The tokenizer is loaded when the first LLM event is counted, so stages
+    # without LLM calls do not wait for it.
+    counter = TokenCountingHandler(tokenizer=encode)
+    token = _active_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _active_counter.reset(token)
+
+
+def current_usage() -> tuple[int, int]:
+    """Prompt and completion tokens counted so far for the current request."""
+    counter = _active_counter.get()
+    if counter is None:
+        return 0, 0
+    return counter.prompt_llm_token_count, counter.completion_llm_token_count
+
+
+def record_usage(
+    prompt: str, completion: str, prompt_tokens: int, completion_tokens: int
+) -> None:
+    """
+    Add usage reported outside the LLM callbacks to the current request's counter.
+
+    Used for completions that were not made through the shared LLM, such as
+    the results of an offline batch job.
+    """
+    counter = _active_counter.get()
+    if counter is not None:
+        counter.llm_token_counts.append(
+            TokenCountingEvent(
+                prompt=prompt,
+                completion=completion,
+                prompt_token_count=prompt_tokens,
+                completion_token_count=completion_tokens,
+            )
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    # Fetch the tokenizer into the local cache for offline runs.
+    get_tokenizer()
+    logger.info(
+        f"Cached the {OPENAI_MODEL} tokenizer in {os.environ['TIKTOKEN_CACHE_DIR']}"
+    )
@@ -0,0 +1,168 @@
+import atexit
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+SERVICE_NAME = "ics-anomaly-explainer"
+
+# OTLP span status codes.
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A timed operation, nested under the span that was current when it started."""
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.status_code = STATUS_OK
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @property
+    def duration_seconds(self) -> Optional[float]:
+        if self.end_time_ns is None:
+            return None
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    def to_otlp(self) -> dict[str, Any]:
+        """Convert the span to its OTLP/JSON representation."""
+        otlp_span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            otlp_span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            otlp_span["status"]["message"] = self.status_message
+        return otlp_span
+
+
+def otlp_value(value: Any) -> dict[str, Any]:
+    """Convert an attribute value to an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+class JsonlSpanExporter:
+    """
+    Appends finished spans to a JSONL file, one OTLP/JSON export request per line.
+
+    Each line is a complete `ExportTraceServiceRequest`, so the file can be
+    read by the OpenTelemetry Collector's `otlpjsonfile` receiver or parsed
+    directly. Writes are serialised, so spans can end on any thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "a", buffering=1)
+        self.lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": otlp_value(SERVICE_NAME)}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp()]}
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request, separators=(",", ":"))
+        with self.lock:
+            if not self.file.closed:
+                self.file.write(line + "\n")
+
+    def shutdown(self) -> None:
+        with self.lock:
+            self.file.close()
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_exporter: Optional[JsonlSpanExporter] = None
+
+
+def configure_tracing(path: str) -> None:
+    """Export every span finished from now on to a JSONL file."""
+    global _exporter
+    shutdown_tracing()
+    _exporter = JsonlSpanExporter(path)
+    atexit.register(shutdown_tracing)
+
+
+def shutdown_tracing() -> None:
+    """Stop exporting spans and close the trace file."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    Time the block as a span nested under the current one.
+
+    The current span is kept in a contextvar, so spans started in asyncio
+    tasks and `asyncio.to_thread` calls nest under the span that created
+    them. An exception raised in the block marks the span as failed.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status_code = STATUS_ERROR
+        current.status_message = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_time_ns = time.time_ns()
+        _current_span.reset(token)
+        if _exporter is not None:
+            _exporter.export(current)
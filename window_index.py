@@ -0,0 +1,305 @@
+import argparse
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from process_anomalies import STAT_NAMES, fetch_detection_points, retrieve_swat_data
+
+logger = logging.getLogger(__name__)
+
+
+BLOCK_SIZE = 32
+
+
+def floor_log2(values: np.ndarray) -> np.ndarray:
+    """Exact floor(log2(x)) of positive integers."""
+    return np.frexp(values)[1] - 1
+
+
+class RangeExtremes:
+    """
+    Range minimum or maximum queries in constant time.
+
+    The column is split into blocks of `block_size`. A range spanning several
+    blocks combines the suffix extreme of its first block, the prefix extreme
+    of its last block and, from a sparse table over the block extremes, the
+    extreme of the whole blocks in between. A range within one block scans at
+    most `block_size` values. This takes about 2n values of memory instead of
+    the n log n of a sparse table over every value.
+    """
+
+    def __init__(self, values: np.ndarray, reduce: np.ufunc, block_size: int):
+        self.values = values
+        self.reduce = reduce
+        self.block_size = block_size
+        # Identity of the reduction, used to pad partial blocks and scans
+        if np.issubdtype(values.dtype, np.integer):
+            info = np.iinfo(values.dtype)
+            self.identity = info.max if reduce is np.minimum else info.min
+        else:
+            self.identity = np.inf if reduce is np.minimum else -np.inf
+
+        rows = len(values)
+        blocks = -(-rows // block_size)
+        padded = np.full(blocks * block_size, self.identity, dtype=values.dtype)
+        padded[:rows] = values
+        padded = padded.reshape(blocks, block_size)
+        self.prefix = reduce.accumulate(padded, axis=1).ravel()[:rows]
+        self.suffix = reduce.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()[:rows]
+
+        # table[k, i] is the extreme of blocks [i, i + 2**k)
+        levels = int(floor_log2(np.array([max(blocks, 1)]))[0]) + 1
+        self.table = np.full((levels, blocks), self.identity, dtype=values.dtype)
+        self.table[0] = reduce.reduce(padded, axis=1)
+        for k in range(1, levels):
+            span = 1 << (k - 1)
+            self.table[k, : blocks - span] = reduce(
+                self.table[k - 1, : blocks - span], self.table[k - 1, span:]
+            )
+
+    def query(self, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """Extremes of the non-empty ranges [start, end)."""
+        last = ends - 1
+        first_block = starts // self.block_size
+        last_block = last // self.block_size
+        result = np.empty(len(starts), dtype=self.values.dtype)
+
+        same = first_block == last_block
+        if same.any():
+            offsets = np.arange(self.block_size)
+            index = starts[same, np.newaxis] + offsets
+            inside = index <= last[same, np.newaxis]
+            index = np.minimum(index, len(self.values) - 1)
+            window = np.where(inside, self.values[index], self.identity)
+            result[same] = self.reduce.reduce(window, axis=1)
+
+        spanning = ~same
+        if spanning.any():
+            extremes = self.reduce(
+                self.suffix[starts[spanning]], self.prefix[last[spanning]]
+            )
+            inner_first = first_block[spanning] + 1
+            inner_count = last_block[spanning] - inner_first
+            has_inner = inner_count > 0
+            if has_inner.any():
+                first = inner_first[has_inner]
+                count = inner_count[has_inner]
+                k = floor_log2(count)
+                inner = self.reduce(
+                    self.table[k, first], self.table[k, first + count - (1 << k)]
+                )
+                extremes[has_inner] = self.reduce(extremes[has_inner], inner)
+            result[spanning] = extremes
+        return result
+
+
+class ColumnIndex:
+    """Windowed statistics of one column, each in constant time."""
+
+    def __init__(self, values: np.ndarray, block_size: int = BLOCK_SIZE):
+        values = np.asarray(values)
+        if not np.issubdtype(values.dtype, np.number):
+            raise TypeError(f"Cannot index column of dtype {values.dtype}")
+        self.values = values
+        self.rows = len(values)
+        self.block_size = block_size
+        # Sums of squares are taken around the rounded column mean, so that
+        # the variance of a window is not lost to cancellation for large
+        # values, and sums of integer columns stay exact.
+        as_float = values.astype(np.float64)
+        self.shift = float(np.round(as_float.mean())) if self.rows else 0.0
+        shifted = as_float - self.shift
+        self.sums = np.concatenate([[0.0], np.cumsum(shifted)])
+        self.squares = np.concatenate([[0.0], np.cumsum(shifted**2)])
+        self.minimum = RangeExtremes(values, np.minimum, block_size)
+        self.maximum = RangeExtremes(values, np.maximum, block_size)
+
+    def stats(self, starts: np.ndarray, ends: np.ndarray) -> dict[str, np.ndarray]:
+        """
+        Statistics of the windows [start, end), clipped to the column.
+
+        Returns:
+            dict: An array per name in `STAT_NAMES`, zero for empty windows as
+            in `calculate_stats`.
+        """
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, self.rows)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), 0, self.rows)
+        ends = np.maximum(starts, ends)
+        counts = ends - starts
+        stats = {
+            "mean": np.zeros(len(counts)),
+            "std": np.zeros(len(counts)),
+            "min": np.zeros(len(counts)),
+            "max": np.zeros(len(counts)),
+            "count": counts,
+        }
+        # Windows up to a block long are reduced directly, which is as fast
+        # and avoids the rounding error of differences of large prefix sums.
+        short = (counts > 0) & (counts <= self.block_size)
+        long = counts > self.block_size
+        for selected, compute in (
+            (short, self.__short_stats),
+            (long, self.__long_stats),
+        ):
+            if selected.any():
+                for name, values in compute(starts[selected], ends[selected]).items():
+                    stats[name][selected] = values
+        return stats
+
+    def __short_stats(self, starts: np.ndarray, ends: np.ndarray) -> dict:
+        index = starts[:, np.newaxis] + np.arange(self.block_size)
+        inside = index < ends[:, np.newaxis]
+        window = self.values[np.minimum(index, self.rows - 1)].astype(np.float64)
+        n = ends - starts
+        means = np.where(inside, window, 0.0).sum(axis=1) / n
+        deviations = np.where(inside, window - means[:, np.newaxis], 0.0)
+        return {
+            "mean": means,
+            "std": np.sqrt((deviations**2).sum(axis=1) / n),
+            "min": np.where(inside, window, np.inf).min(axis=1),
+            "max": np.where(inside, window, -np.inf).max(axis=1),
+        }
+
+    def __long_stats(self, starts: np.ndarray, ends: np.ndarray) -> dict:
+        n = ends - starts
+        shifted_means = (self.sums[ends] - self.sums[starts]) / n
+        squares = (self.squares[ends] - self.squares[starts]) / n
+        return {
+            "mean": shifted_means + self.shift,
+            "std": np.sqrt(np.maximum(squares - shifted_means**2, 0.0)),
+            "min": self.minimum.query(starts, ends),
+            "max": self.maximum.query(starts, ends),
+        }
+
+
+class WindowStatsIndex:
+    """
+    Count, mean, std, min and max of any window [start, end) of the SWAT data
+    in constant time.
+
+    Each column is indexed on its first query, with prefix sums of the values
+    and their squares for the mean and std, and block-wise sparse tables for
+    the min and max.
+    """
+
+    def __init__(self, test_dataset: pd.DataFrame, block_size: int = BLOCK_SIZE):
+        self.test_dataset = test_dataset
+        self.block_size = block_size
+        self.columns: dict[str, ColumnIndex] = {}
+
+    def column(self, name: str) -> ColumnIndex:
+        if name not in self.columns:
+            self.columns[name] = ColumnIndex(
+                self.test_dataset[name].to_numpy(), self.block_size
+            )
+        return self.columns[name]
+
+    def query(self, column: str, start: int, end: int) -> dict:
+        """Statistics of one window, in the format of `calculate_stats`."""
+        stats = self.column(column).stats(np.array([start]), np.array([end]))
+        result = {name: float(stats[name][0]) for name in STAT_NAMES}
+        result["count"] = int(stats["count"][0])
+        return result
+
+    def baseline_sweep(
+        self,
+        detection_points: np.ndarray,
+        lengths: list[int],
+        columns: Optional[list[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        Baseline statistics of each column for each baseline length.
+
+        Each baseline ends where the baseline of `compute_anomaly_statistics`
+        ends, just before the detection window, and is cut short at the start
+        of the data.
+
+        Args:
+            detection_points (np.ndarray): Detection points of the window.
+            lengths (list[int]): Baseline lengths in rows.
+            columns (list[str], optional): Columns to sweep. Defaults to all
+                numeric columns.
+
+        Returns:
+            pd.DataFrame: One row per column and length, with the baseline
+            statistics and the change of the detected mean from the baseline mean.
+        """
+        if columns is None:
+            columns = list(self.test_dataset.select_dtypes("number").columns)
+        points = np.asarray(detection_points)
+        end = max(int(points.min()) - 1, 0)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts = np.maximum(end - lengths, 0)
+        ends = np.full(len(lengths), end)
+
+        frames = []
+        for column in columns:
+            stats = self.column(column).stats(starts, ends)
+            detected_mean = float(
+                np.mean(self.test_dataset[column].to_numpy()[points], dtype=np.float64)
+            )
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change = (detected_mean - stats["mean"]) / stats["mean"] * 100
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "column": column,
+                        "length": lengths,
+                        "start": starts,
+                        "end": ends,
+                        **stats,
+                        "detected_mean": detected_mean,
+                        "change_percent": change,
+                    }
+                )
+            )
+        return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sweep baseline window lengths before an attack's detection window"
+    )
+    parser.add_argument(
+        "--attack", type=int, required=True, help="Attack number to sweep"
+    )
+    parser.add_argument(
+        "--lengths",
+        nargs="+",
+        type=int,
+        required=True,
+        help="Baseline lengths in rows",
+    )
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=None,
+        help="SWAT columns to sweep (default: all sensors and actuators)",
+    )
+    parser.add_argument(
+        "--output", type=str, default=None, help="CSV file for the sweep results"
+    )
+    args = parser.parse_args()
+
+    detection_points = fetch_detection_points()[args.attack]
+    test_dataset = retrieve_swat_data("test", columns=args.columns)
+    index = WindowStatsIndex(test_dataset)
+    sweep = index.baseline_sweep(detection_points, args.lengths, args.columns)
+
+    if args.output:
+        sweep.to_csv(args.output, index=False)
+        logger.info(f"Sweep written to {args.output}")
+    logger.info(
+        f"Baseline sweep of attack {args.attack}:\n{sweep.to_string(index=False)}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    main()